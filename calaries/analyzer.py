@@ -0,0 +1,426 @@
+import copy
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from diet_plans import build_local_plan
+
+
+class AnalyzerError(Exception):
+    pass
+
+
+class CircuitOpenError(AnalyzerError):
+    pass
+
+
+class DeadlineExceeded(AnalyzerError):
+    pass
+
+
+class PermanentError(AnalyzerError):
+    """A failure that retrying cannot fix (missing configuration, no recorded answer)."""
+
+
+# Errors that fail the call at once: no retry, and not counted against the breaker.
+NOT_RETRYABLE = (PermanentError, json.JSONDecodeError)
+
+
+# --- Latency Histograms ---
+class LatencyHistogram:
+    """Cumulative Prometheus-style buckets plus a window of recent samples for percentiles."""
+
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, window=500):
+        self._lock = threading.Lock()
+        self.bucket_counts = [0] * len(self.BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self._recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self._recent.append(seconds)
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    self.bucket_counts[i] += 1
+
+    def percentile(self, pct):
+        with self._lock:
+            samples = sorted(self._recent)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+    def snapshot(self):
+        p = {f"p{q}": self.percentile(q) for q in (50, 95, 99)}
+        return {
+            "count": self.count,
+            "sum": round(self.total, 4),
+            "buckets": {str(b): c for b, c in zip(self.BUCKETS, self.bucket_counts)},
+            **{k: round(v, 4) if v is not None else None for k, v in p.items()},
+        }
+
+
+# --- Circuit Breaker ---
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures; after `reset_timeout` seconds
+    a single probe call is let through (half-open) and its outcome closes or re-opens it."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def release(self):
+        """End a probe without counting it (the request was bad, not the backend)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+# --- Backends ---
+class AnalyzerBackend:
+    """A model provider. `timeout` is a per-call deadline in seconds (None = no limit)."""
+
+    name = "base"
+
+    def analyze_image(self, image_part, prompt, schema, timeout=None):
+        raise NotImplementedError
+
+    def generate_text(self, prompt, timeout=None):
+        raise NotImplementedError
+
+    def stream_text(self, prompt, timeout=None):
+        yield self.generate_text(prompt, timeout)
+
+
+class GeminiBackend(AnalyzerBackend):
+    name = "gemini"
+
+    def __init__(self, api_key, model_name="gemini-2.5-flash"):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def model(self):
+        if not self.api_key:
+            raise PermanentError("GEMINI_API_KEY is not configured")
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    @staticmethod
+    def _options(timeout):
+        return {"timeout": timeout} if timeout else None
+
+    def analyze_image(self, image_part, prompt, schema, timeout=None):
+        from google.generativeai import types
+        response = self.model().generate_content(
+            contents=[image_part, prompt],
+            generation_config=types.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=schema,
+                temperature=0.1
+            ),
+            request_options=self._options(timeout),
+        )
+        return json.loads(response.text)
+
+    def generate_text(self, prompt, timeout=None):
+        return self.model().generate_content(prompt, request_options=self._options(timeout)).text
+
+    def stream_text(self, prompt, timeout=None):
+        response = self.model().generate_content(prompt, stream=True, request_options=self._options(timeout))
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+class StubBackend(AnalyzerBackend):
+    """Deterministic offline backend for tests and load tests.
+
+    Image results are derived from a hash of the image bytes, so the same image always
+    gets the same answer; text prompts are answered with the local diet-plan builder.
+    """
+
+    name = "stub"
+
+    def __init__(self, delay=0.0, chunk_size=120):
+        self.delay = delay
+        self.chunk_size = chunk_size
+
+    def analyze_image(self, image_part, prompt, schema, timeout=None):
+        time.sleep(self.delay)
+        digest = hashlib.sha256(image_part["data"]).digest()
+        protein, carbs, fat = 5 + digest[0] % 45, 10 + digest[1] % 90, 3 + digest[2] % 40
+        return {
+            "total_calories": protein * 4 + carbs * 4 + fat * 9,
+            "total_nutrients": {
+                "protein_g": protein,
+                "carbs_g": carbs,
+                "fat_g": fat,
+                "cholesterol_mg": digest[3] % 150,
+                "sodium_mg": 100 + digest[4] * 4,
+                "vitamin_c_mg": digest[5] % 60,
+            },
+            "analysis_notes": f"Stub analysis {digest.hex()[:8]}: mixed plate with grains, protein and vegetables.",
+        }
+
+    def _plan_for(self, prompt):
+        limit = re.search(r"Daily Limit: (\d+)", prompt)
+        goal = re.search(r"Goal: (\w+)", prompt)
+        return build_local_plan(int(limit.group(1)) if limit else 2000, goal.group(1) if goal else "maintain")
+
+    def generate_text(self, prompt, timeout=None):
+        time.sleep(self.delay)
+        return self._plan_for(prompt)
+
+    def stream_text(self, prompt, timeout=None):
+        text = self._plan_for(prompt)
+        for i in range(0, len(text), self.chunk_size):
+            time.sleep(self.delay)
+            yield text[i:i + self.chunk_size]
+
+
+class ReplayBackend(AnalyzerBackend):
+    """Answers from a JSONL file of recorded responses.
+
+    With `record_from` set, misses are forwarded to that backend and appended to the
+    file, so a session against the real model can be captured and replayed later.
+    """
+
+    name = "replay"
+
+    def __init__(self, path, record_from=None):
+        self.path = path
+        self.record_from = record_from
+        self._lock = threading.Lock()
+        self._responses = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as fh:
+                for line in fh:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._responses[entry["key"]] = entry["response"]
+
+    @staticmethod
+    def key(kind, prompt, data=b""):
+        h = hashlib.sha256()
+        for part in (kind.encode(), prompt.encode("utf-8"), data):
+            h.update(part)
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _lookup(self, key, produce):
+        # Callers get a copy: record_scan annotates results in place.
+        if key in self._responses:
+            return copy.deepcopy(self._responses[key])
+        if self.record_from is None:
+            raise PermanentError("No recorded response for this request")
+        response = produce()
+        with self._lock:
+            self._responses[key] = copy.deepcopy(response)
+            with open(self.path, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps({"key": key, "response": response}) + "\n")
+        return response
+
+    def analyze_image(self, image_part, prompt, schema, timeout=None):
+        key = self.key("image", prompt, image_part["data"])
+        return self._lookup(key, lambda: self.record_from.analyze_image(image_part, prompt, schema, timeout))
+
+    def generate_text(self, prompt, timeout=None):
+        return self._lookup(self.key("text", prompt), lambda: self.record_from.generate_text(prompt, timeout))
+
+
+# --- Resilience Wrapper ---
+class ResilientAnalyzer:
+    """Wraps a backend with deadlines, jittered retries, hedging and a circuit breaker.
+
+    - A call (all its attempts and backoff sleeps) must finish within `deadline`
+      seconds; each attempt only gets the time that is left.
+    - Failed attempts are retried up to `retries` times with full-jitter exponential
+      backoff, unless the error is NOT_RETRYABLE or the deadline would run out first.
+    - Latency is tracked per operation. Once `hedge_min_samples` latencies of an
+      operation are known, an attempt still running after its `hedge_percentile`
+      latency gets a second, parallel request; the first answer wins.
+    - The breaker fails calls fast while the backend keeps failing.
+    """
+
+    def __init__(self, backend, deadline=30.0, retries=2, backoff=0.5, hedge_percentile=95,
+                 hedge_min_samples=20, breaker=None, max_inflight=32):
+        self.backend = backend
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.histograms = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix=f"analyzer-{backend.name}")
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "errors": 0, "retries": 0, "hedges": 0, "deadline_exceeded": 0, "rejected": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def histogram(self, operation):
+        with self._lock:
+            if operation not in self.histograms:
+                self.histograms[operation] = LatencyHistogram()
+            return self.histograms[operation]
+
+    def _timed(self, fn, timeout, histogram):
+        t0 = time.perf_counter()
+        result = fn(timeout)
+        histogram.observe(time.perf_counter() - t0)
+        return result
+
+    def _hedge_delay(self, histogram):
+        if not self.hedge_percentile or histogram.count < self.hedge_min_samples:
+            return None
+        return histogram.percentile(self.hedge_percentile)
+
+    def _attempt(self, fn, timeout, histogram):
+        expires = time.monotonic() + timeout
+        pending = {self._pool.submit(self._timed, fn, timeout, histogram)}
+        hedge_after = self._hedge_delay(histogram)
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = wait(pending, timeout=hedge_after)
+            if not done:
+                self._count("hedges")
+                pending.add(self._pool.submit(self._timed, fn, expires - time.monotonic(), histogram))
+        error = None
+        while pending:
+            remaining = expires - time.monotonic()
+            done, pending = wait(pending, timeout=max(0, remaining), return_when=FIRST_COMPLETED)
+            if not done:
+                # Abandoned calls keep running in the pool until the backend's own timeout.
+                self._count("deadline_exceeded")
+                raise DeadlineExceeded(f"{self.backend.name} did not answer within {timeout:.3g}s")
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def call(self, fn, deadline=None, operation="call"):
+        """Run `fn(timeout)` under one overall deadline; `timeout` is the time left."""
+        deadline = deadline or self.deadline
+        expires = time.monotonic() + deadline
+        histogram = self.histogram(operation)
+        self._count("calls")
+        error = None
+        for attempt in range(self.retries + 1):
+            remaining = expires - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self.breaker.allow():
+                self._count("rejected")
+                raise CircuitOpenError(f"{self.backend.name} is unavailable, try again shortly") from error
+            try:
+                result = self._attempt(fn, remaining, histogram)
+            except NOT_RETRYABLE:
+                self.breaker.release()
+                self._count("errors")
+                raise
+            except Exception as e:
+                error = e
+                self.breaker.record_failure()
+                if attempt < self.retries:
+                    pause = random.uniform(0, self.backoff * (2 ** attempt))
+                    if time.monotonic() + pause >= expires:
+                        break
+                    self._count("retries")
+                    time.sleep(pause)
+                continue
+            self.breaker.record_success()
+            return result
+        self._count("errors")
+        if error is None:
+            error = DeadlineExceeded(f"{self.backend.name} did not answer within {deadline:g}s")
+        raise error
+
+    def analyze_image(self, image_part, prompt, schema, deadline=None):
+        return self.call(lambda timeout: self.backend.analyze_image(image_part, prompt, schema, timeout),
+                         deadline, "analyze_image")
+
+    def generate_text(self, prompt, deadline=None):
+        return self.call(lambda timeout: self.backend.generate_text(prompt, timeout), deadline, "generate_text")
+
+    def stream_text(self, prompt, deadline=None):
+        """Streams are neither retried nor hedged; the breaker and histogram still apply."""
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise CircuitOpenError(f"{self.backend.name} is unavailable, try again shortly")
+        self._count("calls")
+        t0 = time.perf_counter()
+        try:
+            for text in self.backend.stream_text(prompt, deadline or self.deadline):
+                yield text
+        except GeneratorExit:
+            self.breaker.record_success()
+            raise
+        except NOT_RETRYABLE:
+            self._count("errors")
+            self.breaker.release()
+            raise
+        except Exception:
+            self._count("errors")
+            self.breaker.record_failure()
+            raise
+        self.histogram("stream_text").observe(time.perf_counter() - t0)
+        self.breaker.record_success()
+
+    def stats(self):
+        with self._lock:
+            histograms = dict(self.histograms)
+        return {
+            "backend": self.backend.name,
+            "breaker": self.breaker.state,
+            "latency_seconds": {op: h.snapshot() for op, h in histograms.items()},
+            **self.counters,
+        }
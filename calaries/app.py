@@ -1,52 +1,99 @@
 import os
 import json
-import razorpay
+import hashlib
+import itertools
+import re
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from io import BytesIO
-from functools import wraps
+from functools import partial, wraps
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, Response, abort
+from flask import Blueprint, Flask, current_app, make_response, render_template, request, jsonify, redirect, url_for, flash, Response, abort, stream_with_context, g
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.http import is_resource_modified
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy import bindparam, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
 from dotenv import load_dotenv
-import google.generativeai as genai
-from google.generativeai import types
-from PIL import Image
+
+from scan_cache import ScanCache, MemoryCacheBackend, SQLCacheBackend, schema_fingerprint
+from phash_index import PerceptualIndex, dhash, hash_to_hex, hex_to_hash
+from image_pipeline import PipelineStats, preprocess_image
+from scan_queue import QueueFull, ScanWorkerPool, SQLiteJobQueue
+from exporters import EXPORT_FORMATS, gzip_chunks, load_pyarrow
+from object_cache import ObjectCache
+from diet_plans import build_local_plan, daily_calorie_target, plan_profile_key
+from analyzer import CircuitBreaker, GeminiBackend, ReplayBackend, ResilientAnalyzer, StubBackend
+from profiling import RequestProfiler
+from db_config import REPLICA_BIND, RoutingSession, engine_options, read_replica
+from rate_limit import MemoryRateStore, RateLimited, RateLimiter, SQLRateStore, parse_limit
+from idempotency import IdempotencyConflict, IdempotencyStore, RequestInProgress
+from importers import IMPORT_FORMATS
 
 # --- Config & Setup ---
 load_dotenv()
-app = Flask(__name__)
-
-# Security & DB Config
-app.config['SECRET_KEY'] = os.getenv("SECRET_KEY", "dev-secret-key")
-# Defaults to SQLite. Change to your MySQL URL for production.
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL", "sqlite:///nutriscan_saas.db")
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Initialize APIs
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    # Robust Model Selection
-    try:
-        model = genai.GenerativeModel("gemini-2.5-flash")
-    except:
-        model = genai.GenerativeModel("gemini-2.5-flash")
-    
-    # Text model for diet plans
-    text_model = genai.GenerativeModel("gemini-2.5-flash")
 
-# Initialize Razorpay
-razorpay_client = None
-if os.getenv("RAZORPAY_KEY_ID"):
-    razorpay_client = razorpay.Client(auth=(os.getenv("RAZORPAY_KEY_ID"), os.getenv("RAZORPAY_KEY_SECRET")))
+# --- Model Backends ---
+# ANALYZER_BACKEND: "gemini" (default), "stub" (deterministic, offline) or "replay"
+# (answers from ANALYZER_REPLAY_PATH; with ANALYZER_RECORD=1 misses go to Gemini and are recorded).
+def build_analyzer():
+    kind = os.getenv("ANALYZER_BACKEND", "gemini").lower()
+    gemini = GeminiBackend(GEMINI_API_KEY)
+    if kind == "stub":
+        backend = StubBackend(delay=float(os.getenv("STUB_MODEL_DELAY", 0)))
+    elif kind == "replay":
+        backend = ReplayBackend(os.getenv("ANALYZER_REPLAY_PATH", "recorded_responses.jsonl"),
+                                record_from=gemini if os.getenv("ANALYZER_RECORD") else None)
+    else:
+        backend = gemini
+    return ResilientAnalyzer(
+        backend,
+        deadline=float(os.getenv("ANALYZER_DEADLINE", 30)),
+        retries=int(os.getenv("ANALYZER_RETRIES", 2)),
+        hedge_percentile=float(os.getenv("ANALYZER_HEDGE_PERCENTILE", 95)),
+        breaker=CircuitBreaker(failure_threshold=int(os.getenv("ANALYZER_BREAKER_FAILURES", 5)),
+                               reset_timeout=float(os.getenv("ANALYZER_BREAKER_RESET", 30))),
+    )
+
+analyzer = build_analyzer()
+
+# Initialize Razorpay (imported on first payment; it drags in requests)
+_razorpay_client = None
+
+def get_razorpay_client():
+    global _razorpay_client
+    if _razorpay_client is None and os.getenv("RAZORPAY_KEY_ID"):
+        import razorpay
+        _razorpay_client = razorpay.Client(auth=(os.getenv("RAZORPAY_KEY_ID"), os.getenv("RAZORPAY_KEY_SECRET")))
+    return _razorpay_client
 
-# Initialize DB & Login
-db = SQLAlchemy(app)
+# Initialize DB & Login (bound to the app in create_app)
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'main.login'
+
+# --- Request Profiling ---
+# PROFILE_REQUESTS=1 adds Server-Timing headers and /metrics. Requests over
+# PROFILE_MAX_QUERIES statements are logged; PROFILE_SAMPLE_RATE of requests run under
+# cProfile and those slower than PROFILE_SLOW_MS show up in /admin/profiles.
+profiler = RequestProfiler(
+    enabled=os.getenv("PROFILE_REQUESTS", "0") == "1",
+    max_queries=int(os.getenv("PROFILE_MAX_QUERIES", 20)),
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", 0)),
+    slow_ms=float(os.getenv("PROFILE_SLOW_MS", 500)),
+)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
 # --- Custom Admin Decorator ---
 def admin_required(f):
@@ -54,7 +101,7 @@ def admin_required(f):
     def decorated_function(*args, **kwargs):
         if not current_user.is_authenticated or not current_user.is_admin:
             flash("You do not have permission to access this page.", "error")
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         return f(*args, **kwargs)
     return decorated_function
 
@@ -136,54 +183,745 @@ class User(UserMixin, db.Model):
 # 3. Food Log Model
 class FoodLog(db.Model):
     __tablename__ = 'food_logs'
+    __table_args__ = (
+        # Per-user history, today/calendar ranges and keyset pagination.
+        db.Index('ix_food_logs_user_date', 'user_id', 'date'),
+        # Site-wide newest scans (the admin dashboard's recent activity list).
+        db.Index('ix_food_logs_date_user', 'date', 'user_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     
-    food_name = db.Column(db.String(255)) 
+    food_name = db.Column(db.String(255))  # legacy: full notes, truncated; see FoodLogDetail
+    display_name = db.Column(db.String(80))  # short label read by history/calendar/dashboard
     calories = db.Column(db.Integer) 
     protein = db.Column(db.Integer)
     carbs = db.Column(db.Integer)
     fat = db.Column(db.Integer)
     
     user = db.relationship('User', backref=db.backref('logs', lazy=True))
+    # Only loaded when touched (the detail view), never by list queries.
+    details = db.relationship('FoodLogDetail', uselist=False, lazy='select', cascade='all, delete-orphan')
+
+    # Rows from before display_name existed keep their old food_name until migrate_db
+    # backfills them; list queries select FoodLog.label to cover both.
+    @hybrid_property
+    def label(self):
+        return self.display_name or self.food_name
+
+    @label.expression
+    def label(cls):
+        return db.func.coalesce(cls.display_name, cls.food_name)
+
+    @property
+    def analysis_notes(self):
+        notes = self.details.notes_text if self.details else None
+        return notes if notes is not None else self.food_name  # rows from before food_log_details
+
+# 4. Daily Nutrition Rollup (one row per user per UTC day, kept in step with food_logs)
+class DailyTotals(db.Model):
+    __tablename__ = 'daily_totals'
+    # Rows double as the per-day active-user set for admin metrics.
+    __table_args__ = (db.Index('ix_daily_totals_day_user', 'day', 'user_id'),)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    calories = db.Column(db.Integer, default=0, nullable=False)
+    protein = db.Column(db.Integer, default=0, nullable=False)
+    carbs = db.Column(db.Integer, default=0, nullable=False)
+    fat = db.Column(db.Integer, default=0, nullable=False)
+    count = db.Column(db.Integer, default=0, nullable=False)
+
+# 5. Admin Metrics Snapshots (refreshed periodically instead of counted per page view)
+class MetricsSnapshot(db.Model):
+    __tablename__ = 'metrics_snapshots'
+    id = db.Column(db.Integer, primary_key=True)
+    taken_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    total_users = db.Column(db.Integer, default=0)
+    premium_users = db.Column(db.Integer, default=0)
+    total_scans = db.Column(db.Integer, default=0)
+    active_users_30d = db.Column(db.Integer, default=0)
+
+# 6. Scan Result Cache (content-addressed Gemini responses)
+class ScanCacheEntry(db.Model):
+    __tablename__ = 'scan_cache'
+    key = db.Column(db.String(64), primary_key=True)
+    result = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # TTL purge
+
+# --- Scan Cache ---
+# SCAN_CACHE_BACKEND: "memory" (default), "sql" or "none"
+SCAN_PROMPT = "Analyze this food image. Return JSON with total_calories, analysis_notes (summary), and total_nutrients (protein_g, carbs_g, fat_g)."
+SCAN_CACHE_TTL = int(os.getenv("SCAN_CACHE_TTL", 7 * 86400))
+
+def build_scan_cache():
+    kind = os.getenv("SCAN_CACHE_BACKEND", "memory").lower()
+    if kind == "none":
+        return None
+    if kind == "sql":
+        backend = SQLCacheBackend(db, ScanCacheEntry, ttl_seconds=SCAN_CACHE_TTL)
+    else:
+        backend = MemoryCacheBackend(max_entries=int(os.getenv("SCAN_CACHE_SIZE", 2048)), ttl_seconds=SCAN_CACHE_TTL)
+    return ScanCache(backend, schema_fingerprint(CALORIE_SCHEMA))
+
+scan_cache = build_scan_cache()
+
+# 7. Perceptual hashes of analyzed images (near-duplicate reuse)
+class ScanPHash(db.Model):
+    __tablename__ = 'scan_phash'
+    id = db.Column(db.Integer, primary_key=True)
+    phash = db.Column(db.String(16), nullable=False, index=True)
+    result = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# 8. Rate limit token buckets (used when RATE_LIMIT_STORE=sql)
+class RateLimitBucket(db.Model):
+    __tablename__ = 'rate_limits'
+    key = db.Column(db.String(191), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False, index=True)  # epoch seconds; idle purge
+
+# 9. Idempotency keys for scan submissions (the stored response is replayed to retries)
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    key = db.Column(db.String(191), primary_key=True)  # "<user id>:<client key>"
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)  # NULL while the first request runs
+    response = db.Column(db.Text, nullable=True)
+    mimetype = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+# 10. Full analysis text and raw model output per log, zlib-compressed, read on demand
+class FoodLogDetail(db.Model):
+    __tablename__ = 'food_log_details'
+    food_log_id = db.Column(db.Integer, db.ForeignKey('food_logs.id'), primary_key=True)
+    notes = db.Column(db.LargeBinary)  # zlib(UTF-8 analysis_notes)
+    raw = db.Column(db.LargeBinary)  # zlib(JSON of the CALORIE_SCHEMA result minus analysis_notes)
+
+    @staticmethod
+    def pack(text):
+        return zlib.compress(text.encode("utf-8"), 9) if text else None
+
+    @classmethod
+    def from_result(cls, result):
+        rest = {k: v for k, v in result.items() if k != 'analysis_notes'}
+        return cls(notes=cls.pack(result.get('analysis_notes')),
+                   raw=cls.pack(json.dumps(rest, separators=(",", ":"))))
+
+    @property
+    def notes_text(self):
+        return zlib.decompress(self.notes).decode("utf-8") if self.notes else None
+
+    @property
+    def result(self):
+        if not self.raw:
+            return None
+        result = json.loads(zlib.decompress(self.raw))
+        result['analysis_notes'] = self.notes_text
+        return result
+
+# --- Near-Duplicate Index ---
+# PHASH_MAX_DISTANCE: Hamming radius (out of 64 bits) for reusing a result; -1 disables.
+# The in-memory index maps hash -> scan_phash.id only; a hit reads its result row.
+# PHASH_RELOAD_SECONDS: how often to pull rows other processes have added since.
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", 6))
+PHASH_RELOAD_SECONDS = float(os.getenv("PHASH_RELOAD_SECONDS", 60))
+phash_index = PerceptualIndex(max_distance=PHASH_MAX_DISTANCE) if PHASH_MAX_DISTANCE >= 0 else None
+_phash_last_id = 0
+_phash_loaded_at = None
+_phash_load_lock = threading.Lock()
+
+def ensure_phash_index_loaded():
+    # Load the table once per process, then only rows with a higher id every reload period.
+    global _phash_last_id, _phash_loaded_at
+    if _phash_loaded_at is not None and time.monotonic() - _phash_loaded_at < PHASH_RELOAD_SECONDS: return
+    with _phash_load_lock:
+        if _phash_loaded_at is not None and time.monotonic() - _phash_loaded_at < PHASH_RELOAD_SECONDS: return
+        rows = db.session.query(ScanPHash.id, ScanPHash.phash).filter(ScanPHash.id > _phash_last_id) \
+            .order_by(ScanPHash.id).yield_per(10000)
+        for row in rows:
+            phash_index.add(hex_to_hash(row.phash), row.id)
+            _phash_last_id = row.id
+        _phash_loaded_at = time.monotonic()
+
+def find_near_duplicate(phash):
+    """The stored result for the closest hash within range, or None."""
+    ensure_phash_index_loaded()
+    match = phash_index.nearest(phash)
+    if not match: return None
+    stored = db.session.query(ScanPHash.result).filter_by(id=match[2]).scalar()
+    return json.loads(stored) if stored is not None else None
+
+def remember_phash(phash, result):
+    row = ScanPHash(phash=hash_to_hex(phash), result=json.dumps(result))
+    db.session.add(row)
+    db.session.commit()
+    phash_index.add(phash, row.id)
+
+def compute_phash(image_part):
+    from PIL import Image  # deferred: Pillow is only needed once a scan comes in
+    try:
+        return dhash(Image.open(BytesIO(image_part["data"])))
+    except Exception:
+        return None
+
+# --- Config & Identity Caches ---
+# SiteConfig changes rarely; other workers pick up edits within SITE_CONFIG_TTL.
+# USER_CACHE_TTL (default 0 = off) lets load_user skip the users query on most requests;
+# a ban or upgrade then reaches other workers within that many seconds.
+site_config_cache = ObjectCache("site_config", int(os.getenv("SITE_CONFIG_TTL", 60)), max_entries=1)
+user_cache = ObjectCache("users", int(os.getenv("USER_CACHE_TTL", 0)))
+
+def row_snapshot(obj):
+    return {c.key: getattr(obj, c.key) for c in obj.__table__.columns}
+
+def get_site_config():
+    """Read-only SiteConfig (or None), memoized per request and per process."""
+    if 'site_config' in g:
+        return g.site_config
+    values = site_config_cache.get('config')
+    if values is None:
+        row = SiteConfig.query.first()
+        values = row_snapshot(row) if row else {}
+        site_config_cache.set('config', values)
+    # A transient copy: safe to read, never attached to the session.
+    g.site_config = SiteConfig(**values) if values else None
+    return g.site_config
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    values = user_cache.get(user_id)
+    if values is not None:
+        # Re-attach without a SELECT; changes made during the request still flush normally.
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+    user = db.session.get(User, user_id)
+    if user is not None:
+        user_cache.set(user_id, row_snapshot(user))
+    return user
+
+@event.listens_for(Session, "after_flush")
+def invalidate_cached_rows(session, flush_context):
+    # Any flushed change to a user or the site config (profile edits, bans, payments,
+    # settings) drops the cached copy, so explicit invalidation can't be forgotten.
+    for obj in list(session.dirty) + list(session.deleted) + list(session.new):
+        if isinstance(obj, User) and obj.id is not None:
+            user_cache.invalidate(obj.id)
+        elif isinstance(obj, SiteConfig):
+            site_config_cache.invalidate()
+
+# --- Rate Limits ---
+# RATE_LIMIT_STORE: "memory" (default, per process), "sql" (shared, rate_limits table) or "none".
+# Limits are "count/period" token buckets per user (or per IP for the demo);
+# RATE_LIMIT_<SCOPE>_<PLAN> overrides a default, "none" lifts it.
+RATE_LIMIT_DEFAULTS = {
+    ("scan", "trial"): "20/hour",
+    ("scan", "premium"): "120/hour",
+    ("scan", "demo"): "5/hour",
+    ("diet", "trial"): "5/hour",
+    ("diet", "premium"): "30/hour",
+}
+
+def build_rate_limiter():
+    kind = os.getenv("RATE_LIMIT_STORE", "memory").lower()
+    if kind == "none":
+        store = None
+    elif kind == "sql":
+        store = SQLRateStore(db, RateLimitBucket)
+    else:
+        store = MemoryRateStore()
+    limits = {}
+    for (scope, plan), spec in RATE_LIMIT_DEFAULTS.items():
+        name = f"RATE_LIMIT_{scope.upper()}_{plan.upper()}"
+        limits[(scope, plan)] = os.getenv(name, spec)
+        try:
+            parse_limit(limits[(scope, plan)])
+        except ValueError as e:
+            raise ValueError(f"{name}: {e}") from None
+    return RateLimiter(store, limits)
+
+rate_limiter = build_rate_limiter()
+
+def rate_limited(scope, cost=None):
+    """Charge the caller's `scope` bucket before the view runs; 429 with Retry-After when empty.
+
+    `cost` is an optional callable giving the number of tokens for this request.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if current_user.is_authenticated:
+                plan = "premium" if current_user.is_premium or current_user.is_admin else "trial"
+                identity = f"u{current_user.id}"
+            else:
+                plan, identity = "demo", f"ip{request.remote_addr}"
+            try:
+                rate_limiter.hit(scope, plan, identity, cost() if cost else 1)
+            except RateLimited as e:
+                return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+# --- Idempotent Submissions ---
+# Clients send an Idempotency-Key header (or `idempotency_key` form field) on scans and
+# imports; a retry with the same key gets the first response instead of a second log.
+idempotency = IdempotencyStore(db, IdempotencyKey,
+                               ttl_seconds=int(os.getenv("IDEMPOTENCY_TTL", 86400)),
+                               wait=float(os.getenv("IDEMPOTENCY_WAIT", 30)))
+
+def request_fingerprint():
+    digest = hashlib.sha256(request.path.encode())
+    for name, value in sorted(request.form.items(multi=True)):
+        if name != 'idempotency_key':
+            digest.update(f"{name}={value}".encode())
+    for name, file in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+        digest.update(name.encode())
+        for chunk in iter(lambda: file.stream.read(1 << 16), b""):
+            digest.update(chunk)
+        file.stream.seek(0)
+    return digest.hexdigest()
+
+def idempotent(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        client_key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+        if not client_key:
+            return f(*args, **kwargs)
+        if len(client_key) > 128:
+            return jsonify({"error": "Idempotency-Key is too long"}), 400
+        key = f"{current_user.id}:{client_key}"
+        try:
+            stored = idempotency.begin(key, request_fingerprint())
+        except IdempotencyConflict as e:
+            return jsonify({"error": str(e)}), 422
+        except RequestInProgress as e:
+            return jsonify({"error": str(e)}), 409, {"Retry-After": str(e.retry_after)}
+        if stored is not None:
+            body, status, mimetype = stored
+            return Response(body, status=status, mimetype=mimetype, headers={"Idempotent-Replayed": "true"})
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            idempotency.abandon(key)
+            raise
+        # Server errors and throttling are not final; let the retry run again.
+        if response.status_code >= 500 or response.status_code == 429:
+            idempotency.abandon(key)
+        else:
+            idempotency.complete(key, response.get_data(as_text=True), response.status_code, response.mimetype)
+        return response
+    return decorated_function
 
 # --- Helper Functions ---
+# Uploads are downscaled and re-encoded before they are sent to the model.
+UPLOAD_MAX_DIMENSION = int(os.getenv("UPLOAD_MAX_DIMENSION", 1024))
+UPLOAD_FORMAT = os.getenv("UPLOAD_FORMAT", "jpeg").lower()  # "jpeg" or "webp"
+UPLOAD_QUALITY = int(os.getenv("UPLOAD_QUALITY", 85))
+upload_stats = PipelineStats()
+
 def convert_image_to_part(image_file):
-    image_data = image_file.read()
-    image_file.seek(0)
-    return {"mime_type": "image/jpeg", "data": image_data}
+    return preprocess_image(
+        image_file.stream,
+        max_dimension=UPLOAD_MAX_DIMENSION,
+        fmt=UPLOAD_FORMAT,
+        quality=UPLOAD_QUALITY,
+        stats=upload_stats,
+        fallback_mime=image_file.mimetype,
+    )
 
 def get_calorie_estimation(image_part):
-    prompt = "Analyze this food image. Return JSON with total_calories, analysis_notes (summary), and total_nutrients (protein_g, carbs_g, fat_g)."
+    prompt = SCAN_PROMPT
+    cache_key = None
+    if scan_cache:
+        cache_key = scan_cache.key_for(image_part, prompt)
+        try:
+            cached = scan_cache.get(cache_key)
+        except Exception:
+            # SQL backend without a migrated scan_cache table, or a DB error: ask the model.
+            current_app.logger.warning("scan cache lookup failed", exc_info=True)
+            db.session.rollback()
+            cached = None
+        if cached is not None:
+            return cached
+
+    phash = compute_phash(image_part) if phash_index is not None else None
+    if phash is not None:
+        try:
+            result = find_near_duplicate(phash)
+        except Exception:
+            # No scan_phash table yet (migrate_db not run) or a DB error: ask the model.
+            current_app.logger.warning("near-duplicate lookup failed", exc_info=True)
+            db.session.rollback()
+            phash, result = None, None
+        if result is not None:
+            if cache_key: scan_cache.set(cache_key, result)
+            return result
     try:
-        response = model.generate_content(
-            contents=[image_part, prompt],
-            generation_config=types.GenerationConfig(
-                response_mime_type="application/json",
-                response_schema=CALORIE_SCHEMA,
-                temperature=0.1
-            )
-        )
-        return json.loads(response.text)
+        with profiler.timed("model"):
+            result = analyzer.analyze_image(image_part, prompt, CALORIE_SCHEMA)
     except Exception as e:
         return {"error": str(e)}
+    # Only successful analyses are cached; errors should be retried.
+    if cache_key:
+        scan_cache.set(cache_key, result)
+    if phash is not None:
+        try:
+            remember_phash(phash, result)
+        except Exception:
+            current_app.logger.warning("could not store perceptual hash", exc_info=True)
+            db.session.rollback()
+    return result
+
+# --- Daily Totals ---
+def add_to_daily_totals(logs):
+    """Fold new FoodLog rows into daily_totals in the caller's transaction (caller commits)."""
+    buckets = {}
+    for log in logs:
+        key = (log.user_id, log.date.date())
+        b = buckets.setdefault(key, [0, 0, 0, 0, 0])
+        b[0] += log.calories or 0
+        b[1] += log.protein or 0
+        b[2] += log.carbs or 0
+        b[3] += log.fat or 0
+        b[4] += 1
+    apply_daily_buckets(buckets)
+
+def apply_daily_buckets(buckets):
+    """Add {(user_id, day): [calories, protein, carbs, fat, count]} to daily_totals (caller commits)."""
+    for (user_id, day), (cal, protein, carbs, fat, count) in buckets.items():
+        # Relative UPDATE first so concurrent writers add rather than overwrite.
+        values = {
+            DailyTotals.calories: DailyTotals.calories + cal,
+            DailyTotals.protein: DailyTotals.protein + protein,
+            DailyTotals.carbs: DailyTotals.carbs + carbs,
+            DailyTotals.fat: DailyTotals.fat + fat,
+            DailyTotals.count: DailyTotals.count + count,
+        }
+        query = DailyTotals.query.filter_by(user_id=user_id, day=day)
+        if query.update(values, synchronize_session=False):
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.add(DailyTotals(user_id=user_id, day=day, calories=cal, protein=protein,
+                                           carbs=carbs, fat=fat, count=count))
+        except IntegrityError:
+            # Another request created the row between our UPDATE and INSERT.
+            query.update(values, synchronize_session=False)
+
+def parse_day_arg(value):
+    try:
+        return datetime.fromisoformat(value[:10]).date() if value else None
+    except ValueError:
+        return None
+
+def day_start(day):
+    # Compare FoodLog.date against datetime bounds, never DATE(date), so the
+    # (user_id, date) index can serve the range.
+    return datetime.combine(day, datetime.min.time())
+
+def get_day_calories(user_id, day):
+    total = db.session.query(DailyTotals.calories).filter_by(user_id=user_id, day=day).scalar()
+    return total or 0
+
+# --- Admin Metrics ---
+# One metrics_snapshots row, rewritten in place. It is refreshed by the first admin view
+# after ADMIN_METRICS_TTL, by ?refresh=1, or ahead of time by `flask admin refresh-metrics`
+# from cron so admins never wait on the COUNTs.
+ADMIN_METRICS_TTL = int(os.getenv("ADMIN_METRICS_TTL", 300))
+ADMIN_USERS_PER_PAGE = 50
+METRICS_SNAPSHOT_ID = 1
+
+def refresh_metrics_snapshot():
+    since = (datetime.utcnow() - timedelta(days=30)).date()
+    values = dict(
+        taken_at=datetime.utcnow(),
+        total_users=User.query.count(),
+        premium_users=User.query.filter_by(is_premium=True).count(),
+        total_scans=FoodLog.query.count(),
+        # daily_totals has one row per active user-day, far fewer rows than food_logs.
+        active_users_30d=db.session.query(db.func.count(db.distinct(DailyTotals.user_id)))
+                           .filter(DailyTotals.day >= since).scalar() or 0,
+    )
+    updated = MetricsSnapshot.query.filter_by(id=METRICS_SNAPSHOT_ID).update(values)
+    if not updated:
+        try:
+            db.session.add(MetricsSnapshot(id=METRICS_SNAPSHOT_ID, **values))
+            db.session.commit()
+        except IntegrityError:
+            # Another worker created it first; overwrite that one.
+            db.session.rollback()
+            MetricsSnapshot.query.filter_by(id=METRICS_SNAPSHOT_ID).update(values)
+    # Rows left over from when every refresh inserted a new snapshot.
+    MetricsSnapshot.query.filter(MetricsSnapshot.id != METRICS_SNAPSHOT_ID).delete()
+    db.session.commit()
+    return db.session.get(MetricsSnapshot, METRICS_SNAPSHOT_ID)
+
+def get_metrics_snapshot(max_age=ADMIN_METRICS_TTL):
+    snapshot = db.session.get(MetricsSnapshot, METRICS_SNAPSHOT_ID)
+    if snapshot is None or snapshot.taken_at < datetime.utcnow() - timedelta(seconds=max_age):
+        snapshot = refresh_metrics_snapshot()
+    return snapshot
+
+# --- Scan Recording ---
+DISPLAY_NAME_MAX = 80
+DISPLAY_NAME_BREAK = re.compile(r"(?<=[.!?;])\s|\s[-\u2013\u2014]\s|\s\(")
+
+def short_food_name(notes, limit=DISPLAY_NAME_MAX):
+    """A list label from the model's notes: the first sentence or clause, cut at a word."""
+    text = " ".join((notes or "").split())
+    if not text:
+        return "Unknown"
+    head = DISPLAY_NAME_BREAK.split(text, 1)[0].rstrip(" .;:!?,") or text
+    if len(head) <= limit:
+        return head
+    return head[:limit - 3].rsplit(" ", 1)[0].rstrip(" ,;:") + "..."
+
+def food_log_from_result(user_id, result, when):
+    # The full notes and result go to food_log_details; food_name is no longer written.
+    nutrients = result.get('total_nutrients', {})
+    return FoodLog(
+        user_id=user_id,
+        date=when,
+        display_name=short_food_name(result.get('analysis_notes')),
+        calories=result.get('total_calories', 0),
+        protein=nutrients.get('protein_g', 0),
+        carbs=nutrients.get('carbs_g', 0),
+        fat=nutrients.get('fat_g', 0),
+        details=FoodLogDetail.from_result(result),
+    )
+
+def limit_check(user, total_today):
+    if user.daily_calorie_limit and total_today > user.daily_calorie_limit:
+        return True, f"WARNING: Limit exceeded by {total_today - user.daily_calorie_limit} kcal!"
+    return False, ""
+
+def record_scan(user, result):
+    """Store an analysis as a FoodLog for `user` and annotate it with the daily limit check."""
+    new_log = food_log_from_result(user.id, result, datetime.utcnow())
+    db.session.add(new_log)
+    add_to_daily_totals([new_log])
+    db.session.commit()
+
+    total_today = get_day_calories(user.id, new_log.date.date())
+    limit_alert, limit_msg = limit_check(user, total_today)
+
+    response_data = result
+    response_data['limit_alert'] = limit_alert
+    response_data['limit_message'] = limit_msg
+    return response_data
+
+FOOD_LOG_INSERT_COLUMNS = ('user_id', 'date', 'display_name', 'calories', 'protein', 'carbs', 'fat')
+
+def record_scans(user, results):
+    """Store several analyses with one executemany per table and one commit."""
+    now = datetime.utcnow()
+    logs = [food_log_from_result(user.id, r, now) for r in results]
+    if logs:
+        db.session.execute(db.insert(FoodLog), [
+            {c: getattr(log, c) for c in FOOD_LOG_INSERT_COLUMNS} for log in logs
+        ])
+        # MySQL has no INSERT ... RETURNING; the batch shares user_id and `now`, and one
+        # multi-row INSERT hands out ascending ids, so read them back in one query.
+        ids = db.session.scalars(
+            db.select(FoodLog.id).filter_by(user_id=user.id, date=now)
+            .order_by(FoodLog.id.desc()).limit(len(logs))
+        ).all()[::-1]
+        db.session.execute(db.insert(FoodLogDetail), [
+            {"food_log_id": log_id, "notes": log.details.notes, "raw": log.details.raw}
+            for log_id, log in zip(ids, logs)
+        ])
+        add_to_daily_totals(logs)
+        db.session.commit()
+    return get_day_calories(user.id, now.date())
+
+# --- Bulk Import ---
+# For moving a user's history over from another tracker (see /import_data and import_logs.py).
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 5000))
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", 200000))
+
+def bulk_add_daily_totals(user_id, buckets):
+    """Fold {day: [calories, protein, carbs, fat, count]} for one user into daily_totals
+    with one executemany UPDATE for days that exist and one multi-row INSERT for the rest."""
+    if not buckets: return
+    existing = {day for (day,) in db.session.query(DailyTotals.day).filter(
+        DailyTotals.user_id == user_id, DailyTotals.day >= min(buckets), DailyTotals.day <= max(buckets))}
+    t = DailyTotals.__table__
+    updates = [{"b_user": user_id, "b_day": day, "b_cal": b[0], "b_protein": b[1], "b_carbs": b[2],
+                "b_fat": b[3], "b_count": b[4]} for day, b in buckets.items() if day in existing]
+    if updates:
+        db.session.execute(
+            t.update().where(t.c.user_id == bindparam("b_user"), t.c.day == bindparam("b_day")).values(
+                calories=t.c.calories + bindparam("b_cal"), protein=t.c.protein + bindparam("b_protein"),
+                carbs=t.c.carbs + bindparam("b_carbs"), fat=t.c.fat + bindparam("b_fat"),
+                count=t.c.count + bindparam("b_count")),
+            updates)
+    new_days = {day: b for day, b in buckets.items() if day not in existing}
+    if new_days:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(DailyTotals), [
+                    {"user_id": user_id, "day": day, "calories": b[0], "protein": b[1], "carbs": b[2],
+                     "fat": b[3], "count": b[4]} for day, b in new_days.items()])
+        except IntegrityError:
+            # A scan created one of these days in the meantime; go day by day instead.
+            apply_daily_buckets({(user_id, day): b for day, b in new_days.items()})
+
+def import_food_logs(user_id, rows, batch_size=IMPORT_BATCH_SIZE, max_rows=None):
+    """Insert parsed rows (see importers) for one user in executemany batches, update
+    daily_totals once per day and commit once. Returns (rows imported, days touched)."""
+    rows = iter(rows)
+    buckets = {}
+    imported = 0
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch: break
+        imported += len(batch)
+        if max_rows and imported > max_rows:
+            raise ValueError(f"At most {max_rows} rows per import")
+        for row in batch:
+            row["user_id"] = user_id
+            row["display_name"] = row.pop("food_name")
+            b = buckets.setdefault(row["date"].date(), [0, 0, 0, 0, 0])
+            b[0] += row["calories"]
+            b[1] += row["protein"]
+            b[2] += row["carbs"]
+            b[3] += row["fat"]
+            b[4] += 1
+        db.session.execute(db.insert(FoodLog), batch)
+    bulk_add_daily_totals(user_id, buckets)
+    db.session.commit()
+    return imported, len(buckets)
+
+# --- Batch Scans ---
+BATCH_SCAN_MAX_IMAGES = int(os.getenv("BATCH_SCAN_MAX_IMAGES", 8))
+# Shared by all requests, so a burst of batches can't open unbounded model calls.
+batch_scan_pool = ThreadPoolExecutor(max_workers=int(os.getenv("BATCH_SCAN_WORKERS", 8)),
+                                     thread_name_prefix="batch-scan")
+
+def estimate_in_app_context(app, image_part):
+    with app.app_context():
+        return get_calorie_estimation(image_part)
+
+# --- Background Scan Jobs ---
+# Job mode needs a long-lived process with a writable disk (in-process worker threads and
+# a local SQLite queue), so it is off unless SCAN_ASYNC=1; serverless deploys stay synchronous.
+SCAN_ASYNC = os.getenv("SCAN_ASYNC", "0") == "1"
+SCAN_JOB_MAX_WAIT = 25
+
+def run_scan_job(app, job):
+    with app.app_context():
+        user = db.session.get(User, job['user_id'])
+        if not user or not user.can_access_ai():
+            return {"error": "Trial Expired. Upgrade to Premium."}
+        result = get_calorie_estimation(job['image_part'])
+        if "error" in result: return result
+        return record_scan(user, result)
+
+scan_jobs = SQLiteJobQueue(
+    os.getenv("SCAN_QUEUE_PATH") or os.path.join(tempfile.gettempdir(), "nutriscan_scan_jobs.db"),
+    max_pending=int(os.getenv("SCAN_QUEUE_MAX_PENDING", 200)),
+    max_per_user=int(os.getenv("SCAN_QUEUE_MAX_PER_USER", 3)),
+)
+# Workers are started on the first enqueued job, not at import; create_app binds the handler.
+scan_workers = ScanWorkerPool(scan_jobs, None, workers=int(os.getenv("SCAN_WORKERS", 4)))
+
+# --- Diet Plans ---
+# Plans are shared between profiles that fall in the same (age, gender, weight bucket,
+# goal, limit bucket); the prompt uses the bucketed values so a plan fits its whole bucket.
+DIET_WEIGHT_STEP = float(os.getenv("DIET_WEIGHT_STEP", 5))
+DIET_LIMIT_STEP = int(os.getenv("DIET_LIMIT_STEP", 100))
+DIET_PLAN_TIMEOUT = float(os.getenv("DIET_PLAN_TIMEOUT", 20))
+diet_plan_cache = ObjectCache("diet_plans", int(os.getenv("DIET_PLAN_TTL", 7 * 86400)),
+                              max_entries=int(os.getenv("DIET_PLAN_CACHE_SIZE", 5000)))
+
+def diet_plan_key(age, gender, weight, goal, daily_limit):
+    return plan_profile_key(age, gender, weight, goal, daily_limit, DIET_WEIGHT_STEP, DIET_LIMIT_STEP)
+
+def diet_plan_prompt(key):
+    age, gender, weight_b, goal, limit_b = key
+    return f"Create a 1-day diet plan for {age}yr old {gender}, {weight_b}kg. Goal: {goal}. Daily Limit: {limit_b} kcal. Use HTML tags (<h3>, <ul>, <li>) only. No markdown."
+
+def get_diet_plan(age, gender, weight, goal, daily_limit):
+    key = diet_plan_key(age, gender, weight, goal, daily_limit)
+    plan = diet_plan_cache.get(key)
+    if plan is not None:
+        return plan
+    try:
+        with profiler.timed("model"):
+            plan = analyzer.generate_text(diet_plan_prompt(key), deadline=DIET_PLAN_TIMEOUT)
+    except Exception:
+        # Model missing, slow or failing: assemble a plan locally (not cached, so the
+        # next request for this bucket tries the model again).
+        return build_local_plan(daily_limit, goal)
+    diet_plan_cache.set(key, plan)
+    return plan
+
+def sse_event(data, event=None):
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data)}\n\n"
+
+def stream_diet_plan(user_id, age, gender, weight, goal, daily_limit):
+    """Yield SSE events for a plan as the model produces it; persist it once complete.
+
+    Events: `chunk` ({"text"}), then `done` ({"limit"}) or `error` ({"error"}). If the
+    client disconnects, the generator is closed and nothing is saved.
+    """
+    key = diet_plan_key(age, gender, weight, goal, daily_limit)
+    plan = diet_plan_cache.get(key)
+    if plan is not None:
+        yield sse_event({"text": plan}, "chunk")
+    else:
+        parts = []
+        deadline = time.monotonic() + DIET_PLAN_TIMEOUT
+        upstream = None
+        try:
+            upstream = analyzer.stream_text(diet_plan_prompt(key), deadline=DIET_PLAN_TIMEOUT)
+            for text in upstream:
+                if time.monotonic() > deadline:
+                    raise TimeoutError("Diet plan generation timed out")
+                if text:
+                    parts.append(text)
+                    yield sse_event({"text": text}, "chunk")
+        except GeneratorExit:
+            raise
+        except Exception as e:
+            if parts:
+                yield sse_event({"error": str(e)}, "error")
+                return
+            # Nothing sent yet: fall back to a local plan rather than failing.
+            plan = build_local_plan(daily_limit, goal)
+            yield sse_event({"text": plan}, "chunk")
+        else:
+            plan = "".join(parts)
+            diet_plan_cache.set(key, plan)
+        finally:
+            if upstream is not None: upstream.close()
+
+    # Re-load the user: the session that served the request may be gone by now.
+    user = db.session.get(User, user_id)
+    user.saved_diet_plan = plan
+    db.session.commit()
+    yield sse_event({"limit": daily_limit}, "done")
 
 # --- Routes ---
+main_bp = Blueprint("main", __name__)
+admin_bp = Blueprint("admin", __name__)
+scans_bp = Blueprint("scans", __name__)
+tracking_bp = Blueprint("tracking", __name__)
+payments_bp = Blueprint("payments", __name__)
 
-@app.route("/")
+@main_bp.route("/")
 def index():
     return render_template("index.html")
 
-@app.route("/register", methods=["GET", "POST"])
+@main_bp.route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
         # Check if registration is allowed (from settings)
-        config = SiteConfig.query.first()
+        config = get_site_config()
         if config and not config.allow_registrations:
             flash("New registrations are currently disabled by the administrator.", "error")
             return render_template("register.html")
@@ -196,10 +934,10 @@ def register():
             db.session.add(new_user)
             db.session.commit()
             login_user(new_user)
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
     return render_template("register.html")
 
-@app.route("/login", methods=["GET", "POST"])
+@main_bp.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         user = User.query.filter_by(email=request.form.get("email")).first()
@@ -208,55 +946,72 @@ def login():
             # Check if active
             if not user.is_active_account:
                 flash("Your account has been deactivated. Contact Admin.", "error")
-                return redirect(url_for('login'))
+                return redirect(url_for('main.login'))
 
             login_user(user)
             
             # Check for Maintenance Mode (Allow Admins only)
-            config = SiteConfig.query.first()
+            config = get_site_config()
             if config and config.maintenance_mode and not user.is_admin:
                 logout_user()
                 flash("System is currently in Maintenance Mode. Please try again later.", "error")
-                return redirect(url_for('login'))
+                return redirect(url_for('main.login'))
 
             if user.is_admin:
-                return redirect(url_for('admin_dashboard'))
-            return redirect(url_for('dashboard'))
+                return redirect(url_for('admin.admin_dashboard'))
+            return redirect(url_for('main.dashboard'))
         flash("Invalid credentials", "error")
     return render_template("login.html")
 
-@app.route("/logout")
+@main_bp.route("/logout")
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route("/dashboard")
+@main_bp.route("/dashboard")
 @login_required
+@read_replica
 def dashboard():
-    logs = FoodLog.query.filter_by(user_id=current_user.id).order_by(FoodLog.date.desc()).all()
-    today_cals = sum(l.calories for l in logs if l.date.date() == datetime.utcnow().date())
+    # The template only shows the latest few scans; full history is paged via /get_all_history.
+    logs = FoodLog.query.filter_by(user_id=current_user.id).order_by(FoodLog.date.desc(), FoodLog.id.desc()).limit(5).all()
+    today_cals = get_day_calories(current_user.id, datetime.utcnow().date())
     rzp_key = os.getenv("RAZORPAY_KEY_ID", "")
-    return render_template("dashboard.html", user=current_user, logs=logs, today_cals=today_cals, rzp_key=rzp_key)
+    return render_template("dashboard.html", user=current_user, logs=logs, today_cals=today_cals, rzp_key=rzp_key,
+                           scan_async=SCAN_ASYNC)
 
 # --- ADMIN ROUTES ---
-@app.route("/admin")
+@admin_bp.cli.command("refresh-metrics")
+def refresh_metrics_command():
+    """Recompute the admin metrics snapshot (run from cron, e.g. every ADMIN_METRICS_TTL)."""
+    snapshot = refresh_metrics_snapshot()
+    print(f"metrics refreshed at {snapshot.taken_at:%Y-%m-%d %H:%M:%S} UTC")
+
+@admin_bp.route("/admin")
 @login_required
 @admin_required
+@read_replica
 def admin_dashboard():
-    total_users = User.query.count()
-    premium_users = User.query.filter_by(is_premium=True).count()
-    total_scans = FoodLog.query.count()
+    metrics = get_metrics_snapshot(max_age=0 if request.args.get('refresh') else ADMIN_METRICS_TTL)
+    total_users = metrics.total_users
+    premium_users = metrics.premium_users
+    total_scans = metrics.total_scans
     total_revenue = premium_users * 99 
     
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    active_users_count = db.session.query(FoodLog.user_id).filter(FoodLog.date >= thirty_days_ago).distinct().count()
-    
     avg_scans = round(total_scans / total_users, 1) if total_users > 0 else 0
     conversion_rate = round((premium_users / total_users * 100), 1) if total_users > 0 else 0
 
-    all_users = User.query.order_by(User.created_at.desc()).all()
-    recent_logs = FoodLog.query.order_by(FoodLog.date.desc()).limit(20).all()
+    # User management is paged and searchable by username/email.
+    q = request.args.get('q', '').strip()
+    users_query = User.query
+    if q:
+        like = f"%{q}%"
+        users_query = users_query.filter(db.or_(User.username.ilike(like), User.email.ilike(like)))
+    users_page = users_query.order_by(User.created_at.desc()).paginate(
+        page=request.args.get('page', 1, type=int), per_page=ADMIN_USERS_PER_PAGE, error_out=False)
+
+    recent_logs = (FoodLog.query.options(joinedload(FoodLog.user).load_only(User.username))
+                   .order_by(FoodLog.date.desc()).limit(20).all())
 
     return render_template(
         "admin.html", 
@@ -265,18 +1020,53 @@ def admin_dashboard():
         premium_users=premium_users,
         total_scans=total_scans,
         total_revenue=total_revenue,
-        active_users=active_users_count,
+        active_users_count=metrics.active_users_30d,
+        metrics_taken_at=metrics.taken_at,
         avg_scans=avg_scans,
         conversion_rate=conversion_rate,
-        all_users=all_users,
+        all_users=users_page.items,
+        users_page=users_page,
+        q=q,
         recent_logs=recent_logs
     )
 
-@app.route("/admin/toggle_status/<int:user_id>")
+@admin_bp.route("/admin/cache_stats")
+@login_required
+@admin_required
+def admin_cache_stats():
+    stats = scan_cache.stats() if scan_cache else {"backend": None}
+    stats["near_duplicates"] = phash_index.stats() if phash_index is not None else None
+    stats["uploads"] = upload_stats.stats()
+    stats["site_config"] = site_config_cache.stats()
+    stats["users"] = user_cache.stats()
+    stats["diet_plans"] = diet_plan_cache.stats()
+    stats["analyzer"] = analyzer.stats()
+    stats["rate_limits"] = rate_limiter.stats()
+    stats["idempotency"] = idempotency.stats()
+    return jsonify(stats)
+
+@admin_bp.route("/admin/profiles")
+@login_required
+@admin_required
+def admin_profiles():
+    if not profiler.enabled:
+        abort(404)
+    return jsonify({"over_query_budget": profiler.flagged(), "slow_requests": list(profiler.profiles)})
+
+@admin_bp.route("/metrics")
+def metrics():
+    # Scraped by Prometheus, so no login; guard with METRICS_TOKEN when exposed publicly.
+    if not profiler.enabled:
+        abort(404)
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        abort(401)
+    return Response(profiler.render(), mimetype="text/plain; version=0.0.4")
+
+@admin_bp.route("/admin/toggle_status/<int:user_id>")
 @login_required
 @admin_required
 def toggle_user_status(user_id):
-    user = User.query.get(user_id)
+    user = db.session.get(User, user_id)
     if user:
         if user.id == current_user.id:
             flash("You cannot deactivate yourself!", "error")
@@ -285,9 +1075,9 @@ def toggle_user_status(user_id):
             db.session.commit()
             status = "Activated" if user.is_active_account else "Deactivated"
             flash(f"User {user.username} has been {status}.", "success")
-    return redirect(url_for('admin_dashboard'))
+    return redirect(url_for('admin.admin_dashboard'))
 
-@app.route("/admin/profile", methods=["GET", "POST"])
+@admin_bp.route("/admin/profile", methods=["GET", "POST"])
 @login_required
 @admin_required
 def admin_profile():
@@ -324,7 +1114,7 @@ def admin_profile():
 
     return render_template("admin_profile.html", user=current_user)
 
-@app.route("/admin/settings", methods=["GET", "POST"])
+@admin_bp.route("/admin/settings", methods=["GET", "POST"])
 @login_required
 @admin_required
 def admin_settings():
@@ -347,14 +1137,16 @@ def admin_settings():
         except Exception as e:
             db.session.rollback()
             flash(f"Error: {str(e)}", "error")
-        return redirect(url_for('admin_settings'))
+        return redirect(url_for('admin.admin_settings'))
 
     return render_template("admin_settings.html", user=current_user, config=config)
 
 # --- Features ---
 
-@app.route("/calculate_calories", methods=["POST"])
+@scans_bp.route("/calculate_calories", methods=["POST"])
 @login_required
+@idempotent
+@rate_limited("scan")
 def calculate_calories():
     if not current_user.can_access_ai():
         return jsonify({"error": "Trial Expired. Upgrade to Premium."}), 403
@@ -364,40 +1156,80 @@ def calculate_calories():
     
     try:
         image_part = convert_image_to_part(file)
+
+        # Job mode: hand the scan to the background pool and let the client poll.
+        # Without SCAN_ASYNC the request is answered synchronously as before.
+        if SCAN_ASYNC and (request.args.get('async') or request.form.get('async')):
+            try:
+                job_id = scan_jobs.enqueue(current_user.id, image_part)
+            except QueueFull as e:
+                return jsonify({"error": str(e)}), 429, {"Retry-After": str(e.retry_after)}
+            scan_workers.start()
+            scan_workers.notify()
+            return jsonify({"job_id": job_id, "status": "queued",
+                            "status_url": url_for('scans.scan_job_status', job_id=job_id)}), 202
+
         result = get_calorie_estimation(image_part)
         
         if "error" in result: return jsonify(result), 500
-        
-        nutrients = result.get('total_nutrients', {})
-        new_log = FoodLog(
-            user_id=current_user.id,
-            food_name=result.get('analysis_notes', 'Unknown'),
-            calories=result.get('total_calories', 0),
-            protein=nutrients.get('protein_g', 0),
-            carbs=nutrients.get('carbs_g', 0),
-            fat=nutrients.get('fat_g', 0)
-        )
-        db.session.add(new_log)
-        db.session.commit()
+        return jsonify(record_scan(current_user, result))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        today_date = datetime.utcnow().date()
-        logs_today = FoodLog.query.filter_by(user_id=current_user.id).all()
-        total_today = sum(l.calories for l in logs_today if l.date.date() == today_date)
-        
-        limit_alert = False
-        limit_msg = ""
-        if current_user.daily_calorie_limit and total_today > current_user.daily_calorie_limit:
-            limit_alert = True
-            limit_msg = f"WARNING: Limit exceeded by {total_today - current_user.daily_calorie_limit} kcal!"
-
-        response_data = result
-        response_data['limit_alert'] = limit_alert
-        response_data['limit_message'] = limit_msg
-        return jsonify(response_data)
+@scans_bp.route("/calculate_calories/batch", methods=["POST"])
+@login_required
+@idempotent
+@rate_limited("scan", cost=lambda: max(1, len(request.files.getlist('food_images'))))
+def calculate_calories_batch():
+    """Analyze every `food_images` file of one meal concurrently and log them together."""
+    if not current_user.can_access_ai():
+        return jsonify({"error": "Trial Expired. Upgrade to Premium."}), 403
+
+    files = [f for f in request.files.getlist('food_images') if f and f.filename]
+    if not files: return jsonify({"error": "No file uploaded"}), 400
+    if len(files) > BATCH_SCAN_MAX_IMAGES:
+        return jsonify({"error": f"At most {BATCH_SCAN_MAX_IMAGES} images per batch"}), 400
+
+    try:
+        parts = [convert_image_to_part(f) for f in files]
+        estimate = partial(estimate_in_app_context, current_app._get_current_object())
+        results = list(batch_scan_pool.map(estimate, parts))
+
+        ok = [r for r in results if "error" not in r]
+        if not ok:
+            return jsonify({"error": "Could not analyze any of the images", "results": results}), 500
+        total_today = record_scans(current_user, ok)
+
+        combined = {"protein_g": 0, "carbs_g": 0, "fat_g": 0}
+        for r in ok:
+            for k in combined:
+                combined[k] += r.get('total_nutrients', {}).get(k, 0) or 0
+        limit_alert, limit_msg = limit_check(current_user, total_today)
+        return jsonify({
+            "results": [dict(r, filename=f.filename) for r, f in zip(results, files)],
+            "total_calories": sum(r.get('total_calories', 0) or 0 for r in ok),
+            "total_nutrients": combined,
+            "limit_alert": limit_alert,
+            "limit_message": limit_msg,
+        })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/demo_analyze", methods=["POST"])
+@scans_bp.route("/scan_jobs/<job_id>")
+@login_required
+def scan_job_status(job_id):
+    # ?wait=N long-polls for up to N seconds (capped) before answering.
+    wait = min(request.args.get('wait', 0, type=float), SCAN_JOB_MAX_WAIT)
+    job = scan_workers.wait(job_id, wait) if wait > 0 else scan_jobs.get(job_id)
+    if not job or job['user_id'] != current_user.id:
+        return jsonify({"error": "Job not found"}), 404
+    body = {"job_id": job['id'], "status": job['status']}
+    if job['result'] is not None:
+        body['result'] = job['result']
+    return jsonify(body)
+
+@scans_bp.route("/demo_analyze", methods=["POST"])
+@rate_limited("scan")
 def demo_analyze():
     file = request.files.get('food_image')
     if not file: return jsonify({"error": "No file uploaded"}), 400
@@ -408,59 +1240,165 @@ def demo_analyze():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/generate_diet_plan", methods=["POST"])
+@tracking_bp.route("/generate_diet_plan", methods=["POST"])
 @login_required
+@rate_limited("diet")
 def generate_diet_plan():
     if not current_user.can_access_ai():
         return jsonify({"error": "Trial Expired"}), 403
-    data = request.json
     try:
-        weight = float(data.get('weight'))
-        height = float(data.get('height'))
-        age = int(data.get('age'))
-        gender = data.get('gender')
-        goal = data.get('goal')
-        activity = data.get('activity')
-
-        if gender == 'male':
-            bmr = (10 * weight) + (6.25 * height) - (5 * age) + 5
-        else:
-            bmr = (10 * weight) + (6.25 * height) - (5 * age) - 161
-
-        multipliers = {"sedentary": 1.2, "light": 1.375, "moderate": 1.55, "active": 1.725}
-        tdee = bmr * multipliers.get(activity, 1.2)
-
-        if goal == 'lose': daily_limit = int(tdee - 500)
-        elif goal == 'gain': daily_limit = int(tdee + 500)
-        else: daily_limit = int(tdee)
-
-        current_user.age = age
-        current_user.gender = gender
-        current_user.current_weight = weight
-        current_user.height = height
-        current_user.activity_level = activity
-        current_user.goal = goal
-        current_user.daily_calorie_limit = daily_limit
+        age, gender, weight, goal, daily_limit = save_diet_profile(request.json)
+        plan = get_diet_plan(age, gender, weight, goal, daily_limit)
+        current_user.saved_diet_plan = plan
         db.session.commit()
-
-        prompt = f"Create a 1-day diet plan for {age}yr old {gender}, {weight}kg. Goal: {goal}. Daily Limit: {daily_limit} kcal. Use HTML tags (<h3>, <ul>, <li>) only. No markdown."
-        response = text_model.generate_content(prompt)
-        current_user.saved_diet_plan = response.text
-        db.session.commit()
-        return jsonify({"plan": response.text, "limit": daily_limit})
+        return jsonify({"plan": plan, "limit": daily_limit})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/export_data")
+@tracking_bp.route("/generate_diet_plan/stream", methods=["POST"])
 @login_required
+@rate_limited("diet")
+def generate_diet_plan_stream():
+    """Same input as /generate_diet_plan; answers with text/event-stream chunks."""
+    if not current_user.can_access_ai():
+        return jsonify({"error": "Trial Expired"}), 403
+    try:
+        profile = save_diet_profile(request.json)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+    return Response(stream_with_context(stream_diet_plan(current_user.id, *profile)), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def save_diet_profile(data):
+    weight = float(data.get('weight'))
+    height = float(data.get('height'))
+    age = int(data.get('age'))
+    gender = data.get('gender')
+    goal = data.get('goal')
+    activity = data.get('activity')
+
+    daily_limit = daily_calorie_target(weight, height, age, gender, activity, goal)
+
+    current_user.age = age
+    current_user.gender = gender
+    current_user.current_weight = weight
+    current_user.height = height
+    current_user.activity_level = activity
+    current_user.goal = goal
+    current_user.daily_calorie_limit = daily_limit
+    db.session.commit()
+    return age, gender, weight, goal, daily_limit
+
+@tracking_bp.route("/export_data")
+@login_required
+@read_replica
 def export_data():
-    logs = FoodLog.query.filter_by(user_id=current_user.id).all()
-    csv = "Date,Food,Calories\n"
-    for l in logs:
-        csv += f"{l.date},{l.food_name},{l.calories}\n"
-    return Response(csv, mimetype="text/csv", headers={"Content-disposition": "attachment; filename=history.csv"})
+    # ?format=csv|ndjson|parquet|arrow, ?gzip=1 compresses the stream.
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unsupported format '{fmt}'"}), 400
+    chunker, mimetype, ext, needs_arrow = EXPORT_FORMATS[fmt]
+    if needs_arrow and load_pyarrow() is None:
+        return jsonify({"error": f"{fmt} export requires pyarrow on the server"}), 501
+
+    user_id = current_user.id
+    def rows():
+        # Server-side cursor, oldest first; only a batch of rows is ever in memory.
+        query = (db.session.query(FoodLog.date, FoodLog.label, FoodLog.calories,
+                                  FoodLog.protein, FoodLog.carbs, FoodLog.fat)
+                 .filter(FoodLog.user_id == user_id)
+                 .order_by(FoodLog.date, FoodLog.id)
+                 .execution_options(stream_results=True)
+                 .yield_per(1000))
+        for row in query:
+            yield tuple(row)
+
+    chunks = chunker(rows())
+    filename = f"history.{ext}"
+    if request.args.get('gzip'):
+        chunks = gzip_chunks(chunks)
+        filename += ".gz"
+        mimetype = "application/gzip"
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={"Content-disposition": f"attachment; filename={filename}"})
+
+# Columns a history client may ask for with ?fields=; the default stays compact.
+HISTORY_FIELDS = {
+    "id": FoodLog.id, "date": FoodLog.date, "food_name": FoodLog.label.label("food_name"), "calories": FoodLog.calories,
+    "protein": FoodLog.protein, "carbs": FoodLog.carbs, "fat": FoodLog.fat,
+}
+HISTORY_DEFAULT_FIELDS = ["id", "date", "food_name", "calories"]
+HISTORY_MAX_PAGE = 200
+
+def encode_history_cursor(log_date, log_id):
+    return f"{log_date.strftime('%Y%m%d%H%M%S%f')}-{log_id}"
+
+def decode_history_cursor(cursor):
+    stamp, log_id = cursor.split("-", 1)
+    return datetime.strptime(stamp, '%Y%m%d%H%M%S%f'), int(log_id)
 
-@app.route("/bmi_calculator", methods=["POST"])
+@tracking_bp.route("/get_all_history")
+@login_required
+@read_replica
+def get_all_history():
+    """Newest-first history, keyset-paginated on (date, id).
+
+    Query args: limit, cursor (from the previous page's next_cursor), start/end
+    (ISO dates, end exclusive) and fields (comma-separated subset of HISTORY_FIELDS).
+    """
+    limit = max(1, min(request.args.get('limit', 50, type=int), HISTORY_MAX_PAGE))
+    fields = [f for f in request.args.get('fields', '').split(',') if f in HISTORY_FIELDS] or HISTORY_DEFAULT_FIELDS
+    # date and id are always loaded; the cursor is built from them.
+    columns = [FoodLog.date, FoodLog.id] + [HISTORY_FIELDS[f] for f in fields if f not in ("date", "id")]
+
+    query = db.session.query(*columns).filter(FoodLog.user_id == current_user.id)
+    start = parse_day_arg(request.args.get('start'))
+    end = parse_day_arg(request.args.get('end'))
+    if start: query = query.filter(FoodLog.date >= day_start(start))
+    if end: query = query.filter(FoodLog.date < day_start(end))
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            before_date, before_id = decode_history_cursor(cursor)
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+        query = query.filter(db.or_(
+            FoodLog.date < before_date,
+            db.and_(FoodLog.date == before_date, FoodLog.id < before_id),
+        ))
+
+    rows = query.order_by(FoodLog.date.desc(), FoodLog.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    history = []
+    for row in rows:
+        item = {f: getattr(row, f) for f in fields}
+        if "date" in item:
+            item["date"] = row.date.isoformat() + "Z"
+        history.append(item)
+    next_cursor = encode_history_cursor(rows[-1].date, rows[-1].id) if has_more else None
+    return jsonify({"history": history, "next_cursor": next_cursor})
+
+@tracking_bp.route("/import_data", methods=["POST"])
+@login_required
+@idempotent
+def import_data():
+    """Bulk-load history from a CSV (our export's columns, or Date/Food/Calories...) or NDJSON file."""
+    file = request.files.get('file')
+    if not file or not file.filename: return jsonify({"error": "No file uploaded"}), 400
+    fmt = (request.form.get('format') or file.filename.rsplit('.', 1)[-1]).lower()
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(IMPORT_FORMATS)}"}), 400
+    try:
+        imported, days = import_food_logs(current_user.id, IMPORT_FORMATS[fmt](file.stream), max_rows=IMPORT_MAX_ROWS)
+    except ValueError as e:  # bad rows or CSV (importers.RowError) or too many of them
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"imported": imported, "days": days})
+
+@tracking_bp.route("/bmi_calculator", methods=["POST"])
 @login_required
 def bmi_calculator():
     try:
@@ -471,41 +1409,107 @@ def bmi_calculator():
     except:
         return jsonify({"error": "Invalid Input"}), 400
 
-@app.route("/get_calendar_data")
+@tracking_bp.route("/get_calendar_data")
 @login_required
+@read_replica
 def get_calendar_data():
-    logs = FoodLog.query.filter_by(user_id=current_user.id).all()
-    calendar_data = {}
-    for log in logs:
-        date_str = log.date.strftime('%Y-%m-%d')
-        if date_str not in calendar_data: calendar_data[date_str] = {"total": 0, "foods": []}
-        calendar_data[date_str]["total"] += log.calories
-        calendar_data[date_str]["foods"].append(f"{log.food_name} ({log.calories})")
+    # FullCalendar sends the visible window as ?start=...&end=... (ISO dates, end exclusive).
+    # ?compact=1 leaves out the per-food strings; the day modal loads them from /get_calendar_day.
+    start = parse_day_arg(request.args.get('start'))
+    end = parse_day_arg(request.args.get('end'))
+    compact = request.args.get('compact') == '1'
 
+    totals = DailyTotals.query.filter_by(user_id=current_user.id)
+    if start:
+        totals = totals.filter(DailyTotals.day >= start)
+    if end:
+        totals = totals.filter(DailyTotals.day < end)
+    totals = totals.order_by(DailyTotals.day).all()
+
+    # The window's rollup rows change with every scan (or import) that lands in it, so they
+    # plus the limit and the latest log make the validator; food_logs is only read on a miss.
     limit = current_user.daily_calorie_limit or 2000
-    final_data = []
-    for date, data in calendar_data.items():
-        status = "success" if data["total"] <= limit else "danger"
-        final_data.append({
-            "title": f"{data['total']} kcal", "start": date,
-            "color": "#10b981" if status == "success" else "#ef4444",
-            "extendedProps": { "foods": data["foods"], "total": data["total"], "limit": limit }
-        })
-    return jsonify(final_data)
+    last_modified = db.session.query(FoodLog.date).filter_by(user_id=current_user.id) \
+        .order_by(FoodLog.date.desc()).limit(1).scalar()
+    fingerprint = hashlib.sha1(repr((
+        current_user.id, limit, compact, last_modified,
+        [(row.day, row.calories, row.count) for row in totals],
+    )).encode()).hexdigest()
+    if not is_resource_modified(request.environ, etag=fingerprint, last_modified=last_modified):
+        response = Response(status=304)
+    else:
+        foods = {}
+        if not compact and totals:
+            logs = db.session.query(FoodLog.date, FoodLog.label.label("label"), FoodLog.calories) \
+                .filter(FoodLog.user_id == current_user.id,
+                        FoodLog.date >= day_start(totals[0].day),
+                        FoodLog.date < day_start(totals[-1].day) + timedelta(days=1)) \
+                .order_by(FoodLog.date)
+            for log in logs:
+                foods.setdefault(log.date.date(), []).append(f"{log.label} ({log.calories})")
+
+        final_data = []
+        for row in totals:
+            props = {"total": row.calories, "limit": limit, "count": row.count}
+            if not compact:
+                props["foods"] = foods.get(row.day, [])
+            final_data.append({
+                "title": f"{row.calories} kcal", "start": row.day.strftime('%Y-%m-%d'),
+                "color": "#10b981" if row.calories <= limit else "#ef4444",
+                "extendedProps": props
+            })
+        response = jsonify(final_data)
+    response.set_etag(fingerprint)
+    response.last_modified = last_modified
+    # Let the browser keep the month but revalidate it on every view.
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
-@app.route("/create_order", methods=["POST"])
+@tracking_bp.route("/get_calendar_day")
+@login_required
+@read_replica
+def get_calendar_day():
+    day = parse_day_arg(request.args.get('date'))
+    if not day:
+        return jsonify({"error": "date must be YYYY-MM-DD"}), 400
+    logs = db.session.query(FoodLog.label.label("label"), FoodLog.calories) \
+        .filter(FoodLog.user_id == current_user.id,
+                FoodLog.date >= day_start(day), FoodLog.date < day_start(day + timedelta(days=1))) \
+        .order_by(FoodLog.date)
+    return jsonify({
+        "date": day.isoformat(),
+        "total": get_day_calories(current_user.id, day),
+        "foods": [f"{log.label} ({log.calories})" for log in logs],
+    })
+
+@tracking_bp.route("/food_logs/<int:log_id>")
+@login_required
+def get_food_log(log_id):
+    # Everything the list views leave out: the full notes and the model's raw result.
+    log = FoodLog.query.filter_by(id=log_id, user_id=current_user.id).first_or_404()
+    raw = log.details.result if log.details else None
+    return jsonify({
+        "id": log.id, "date": log.date.isoformat(), "food_name": log.label,
+        "calories": log.calories, "protein": log.protein, "carbs": log.carbs, "fat": log.fat,
+        "analysis_notes": log.analysis_notes,
+        "nutrients": (raw or {}).get("total_nutrients"),
+    })
+
+@payments_bp.route("/create_order", methods=["POST"])
 @login_required
 def create_order():
+    razorpay_client = get_razorpay_client()
     if not razorpay_client: return jsonify({"error": "Payment config missing"}), 500
     order = razorpay_client.order.create({"amount": 9900, "currency": "INR", "receipt": f"u_{current_user.id}"})
     return jsonify(order)
 
-@app.route("/verify_payment", methods=["POST"])
+@payments_bp.route("/verify_payment", methods=["POST"])
 @login_required
 def verify_payment():
     data = request.json
     try:
-        razorpay_client.utility.verify_payment_signature({
+        get_razorpay_client().utility.verify_payment_signature({
             'razorpay_order_id': data['razorpay_order_id'],
             'razorpay_payment_id': data['razorpay_payment_id'],
             'razorpay_signature': data['razorpay_signature']
@@ -517,12 +1521,47 @@ def verify_payment():
     except:
         return jsonify({"status": "failed"}), 400
 
-@app.route("/pricing")
+@payments_bp.route("/pricing")
 @login_required
 def pricing():
     rzp_key = os.getenv("RAZORPAY_KEY_ID")
     return render_template("pricing.html", user=current_user, rzp_key=rzp_key)
 
+# --- App Factory ---
+def create_app(config=None):
+    app = Flask(__name__)
+    # Behind Vercel/nginx the client IP (used to limit the demo) is in X-Forwarded-For.
+    if int(os.getenv("PROXY_FIX_HOPS", 0)):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.getenv("PROXY_FIX_HOPS")))
+
+    # Security & DB Config
+    app.config['SECRET_KEY'] = os.getenv("SECRET_KEY", "dev-secret-key")
+    # Defaults to SQLite. Change to your MySQL URL for production.
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL", "sqlite:///nutriscan_saas.db")
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Optional read replica for the read-heavy views marked @read_replica.
+    if os.getenv("DATABASE_REPLICA_URL"):
+        app.config['SQLALCHEMY_BINDS'] = {
+            REPLICA_BIND: {"url": os.getenv("DATABASE_REPLICA_URL"),
+                           **engine_options(os.getenv("DATABASE_REPLICA_URL"), prefix="DB_REPLICA_")},
+        }
+    if config:
+        app.config.update(config)
+    # Pool sizing/recycling comes from DB_* env vars (see db_config.engine_options).
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+
+    db.init_app(app)
+    login_manager.init_app(app)
+    profiler.init_app(app)
+    for bp in (main_bp, admin_bp, scans_bp, tracking_bp, payments_bp):
+        app.register_blueprint(bp)
+    # One queue per process; its workers run jobs in the most recently created app.
+    scan_workers.handler = partial(run_scan_job, app)
+    return app
+
+# Module-level app for `flask run`, Vercel and the scripts that `from app import app`.
+app = create_app()
+
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from sqlalchemy import func
+
+from app import app, db, FoodLog, DailyTotals
+
+# Rebuilds the daily_totals rollup from food_logs.
+# Safe to re-run: existing rows are replaced, not added to.
+print("Rebuilding daily_totals from food_logs...")
+with app.app_context():
+    db.create_all()
+    DailyTotals.query.delete()
+
+    day = func.date(FoodLog.date)
+    rows = (
+        db.session.query(
+            FoodLog.user_id,
+            day.label("day"),
+            func.coalesce(func.sum(FoodLog.calories), 0),
+            func.coalesce(func.sum(FoodLog.protein), 0),
+            func.coalesce(func.sum(FoodLog.carbs), 0),
+            func.coalesce(func.sum(FoodLog.fat), 0),
+            func.count(FoodLog.id),
+        )
+        .filter(FoodLog.date.isnot(None))
+        .group_by(FoodLog.user_id, day)
+    )
+
+    batch = []
+    written = 0
+    # Aggregated rows are fetched up front: MySQL cannot insert while a streamed result is open.
+    for user_id, d, cal, protein, carbs, fat, count in rows.all():
+        # SQLite returns DATE() as a string, MySQL as a date.
+        if isinstance(d, str):
+            d = datetime.strptime(d, "%Y-%m-%d").date()
+        batch.append(dict(user_id=user_id, day=d, calories=cal, protein=protein, carbs=carbs, fat=fat, count=count))
+        if len(batch) >= 5000:
+            db.session.bulk_insert_mappings(DailyTotals, batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        db.session.bulk_insert_mappings(DailyTotals, batch)
+        written += len(batch)
+    db.session.commit()
+
+    print(f"Backfill Complete. {written} daily rows written.")
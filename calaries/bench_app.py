@@ -0,0 +1,256 @@
+"""Load test for the NutriScan routes.
+
+Seeds a scratch database (same app-context bootstrapping as make_admin.py), serves the
+app from a threaded WSGI server with the stub analyzer, and drives the hot routes with
+concurrent logged-in clients. Reports req/s, latency percentiles, SQL queries per
+request and peak RSS, and can write the numbers as JSON for comparing commits.
+
+    python bench_app.py --users 200 --logs-per-user 500 --clients 16 --requests 400
+    python bench_app.py --json results/$(git rev-parse --short HEAD).json
+
+DATABASE_URL may point at MySQL; the target database is wiped.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from io import BytesIO
+
+# Must be set before the app is imported.
+os.environ.setdefault("DATABASE_URL", "sqlite:///bench_app.db")
+os.environ.setdefault("ANALYZER_BACKEND", "stub")
+# The per-plan scan limits would turn most of the load into 429s.
+os.environ.setdefault("RATE_LIMIT_STORE", "none")
+os.environ.setdefault("SCAN_QUEUE_PATH", "bench_scan_jobs.db")
+
+import requests
+from flask import g, has_request_context, request
+from PIL import Image
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import make_server
+
+from app import app, db, User, FoodLog, DailyTotals
+
+PASSWORD = "bench-pass"
+ROUTES = ["dashboard", "calculate_calories", "get_calendar_data", "export_data", "admin"]
+
+
+# --- Seeding ---
+def seed(users, logs_per_user, days):
+    rng = random.Random(1)
+    pw_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256')  # hashing is slow; do it once
+    now = datetime.utcnow()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(User(username="BenchAdmin", email="admin@bench.local", password=pw_hash,
+                            is_admin=True, is_premium=True))
+        db.session.execute(db.insert(User), [
+            {"username": f"user{i}", "email": f"user{i}@bench.local", "password": pw_hash,
+             "is_premium": i % 5 == 0, "is_active_account": True, "is_admin": False,
+             "trial_start": now, "created_at": now, "daily_calorie_limit": 2000}
+            for i in range(users)
+        ])
+        db.session.commit()
+
+        user_ids = [uid for (uid,) in db.session.query(User.id).filter(User.is_admin.is_(False))]
+        for uid in user_ids:
+            logs, totals = [], {}
+            for _ in range(logs_per_user):
+                when = now - timedelta(seconds=rng.randint(0, days * 86400))
+                cal, p, c, f = rng.randint(50, 900), rng.randint(0, 60), rng.randint(0, 120), rng.randint(0, 60)
+                logs.append({"user_id": uid, "date": when, "calories": cal, "protein": p, "carbs": c, "fat": f,
+                             "display_name": "Grilled cheese sandwich"})
+                t = totals.setdefault(when.date(), [0, 0, 0, 0, 0])
+                for i, v in enumerate((cal, p, c, f, 1)):
+                    t[i] += v
+            db.session.execute(db.insert(FoodLog), logs)
+            db.session.execute(db.insert(DailyTotals), [
+                {"user_id": uid, "day": d, "calories": t[0], "protein": t[1], "carbs": t[2], "fat": t[3], "count": t[4]}
+                for d, t in totals.items()
+            ])
+            db.session.commit()
+    return ["admin@bench.local"], [f"user{i}@bench.local" for i in range(users)]
+
+
+# --- Instrumentation (bench-only) ---
+# Queries per request, keyed by route, recorded at teardown_request. For a streamed
+# body (export_data) teardown runs again once the stream is done, and that later count,
+# which includes the stream's SELECT, replaces the first; a response header would be
+# written before the stream starts.
+query_counts = {}
+_query_counts_lock = threading.Lock()
+_request_ids = itertools.count()
+
+
+def install_query_counter():
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_query(*args):
+        if has_request_context():
+            g.bench_queries = g.get("bench_queries", 0) + 1
+
+    @app.teardown_request
+    def record_query_count(exc):
+        request_id = g.setdefault("bench_request_id", next(_request_ids))
+        with _query_counts_lock:
+            query_counts.setdefault(request.path.strip("/"), {})[request_id] = g.get("bench_queries", 0)
+
+
+def take_query_counts(route, expected, timeout=5.0):
+    """The counts recorded for `route` since the last call; waits for trailing teardowns."""
+    deadline = time.monotonic() + timeout
+    while len(query_counts.get(route, ())) < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with _query_counts_lock:
+        return list(query_counts.pop(route, {}).values())
+
+
+# --- Load Generation ---
+def make_images(n, size=(1024, 768)):
+    rng = random.Random(3)
+    images = []
+    for _ in range(n):
+        img = Image.effect_noise(size, rng.randint(20, 80)).convert("RGB")
+        buf = BytesIO()
+        img.save(buf, "JPEG", quality=85)
+        images.append(buf.getvalue())
+    return images
+
+
+def login(base, email):
+    session = requests.Session()
+    r = session.post(f"{base}/login", data={"email": email, "password": PASSWORD}, allow_redirects=False)
+    if r.status_code != 302:
+        raise RuntimeError(f"login failed for {email}: {r.status_code}")
+    return session
+
+
+def request_route(session, base, route, images, rng):
+    if route == "calculate_calories":
+        files = {"food_image": ("meal.jpg", rng.choice(images), "image/jpeg")}
+        return session.post(f"{base}/calculate_calories", files=files)
+    if route == "get_calendar_data":
+        month = datetime.utcnow().replace(day=1)
+        return session.get(f"{base}/get_calendar_data",
+                           params={"start": (month - timedelta(days=7)).date().isoformat(),
+                                   "end": (month + timedelta(days=42)).date().isoformat()})
+    if route == "admin":
+        return session.get(f"{base}/admin")
+    return session.get(f"{base}/{route}")
+
+
+def drive(base, route, sessions, total, clients, images):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker(idx):
+        rng = random.Random(idx)
+        session = sessions[idx % len(sessions)]
+        for _ in counter:
+            t0 = time.perf_counter()
+            r = request_route(session, base, route, images, rng)
+            _ = r.content  # include streaming time
+            elapsed = time.perf_counter() - t0
+            with lock:
+                latencies.append(elapsed * 1000)
+                if r.status_code >= 400:
+                    errors[0] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(worker, range(clients)))
+    wall = time.perf_counter() - started
+    queries = take_query_counts(route, total)
+
+    latencies.sort()
+    pct = lambda p: round(latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))], 2)
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "req_per_s": round(len(latencies) / wall, 1),
+        "p50_ms": pct(50), "p95_ms": pct(95), "p99_ms": pct(99),
+        "queries_per_request": round(statistics.mean(queries), 2) if queries else 0,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--logs-per-user", type=int, default=500)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--routes", default=",".join(ROUTES))
+    parser.add_argument("--port", type=int, default=5077)
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--json", help="write machine-readable results to this file")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    if args.skip_seed:
+        admins, users = ["admin@bench.local"], [f"user{i}@bench.local" for i in range(args.users)]
+    else:
+        admins, users = seed(args.users, args.logs_per_user, args.days)
+    print(f"seeded {args.users} users x {args.logs_per_user} logs in {time.perf_counter() - t0:.1f}s")
+
+    install_query_counter()
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # per-request access log
+    server = make_server("127.0.0.1", args.port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{args.port}"
+
+    images = make_images(16)
+    user_sessions = [login(base, email) for email in users[:args.clients]]
+    admin_sessions = [login(base, admins[0])]
+
+    results = {}
+    print(f"\n{'route':20s} {'req/s':>8s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'queries':>8s} {'errors':>7s}")
+    for route in args.routes.split(","):
+        sessions = admin_sessions if route == "admin" else user_sessions
+        res = drive(base, route, sessions, args.requests, args.clients, images)
+        results[route] = res
+        print(f"{route:20s} {res['req_per_s']:8.1f} {res['p50_ms']:9.2f} {res['p95_ms']:9.2f} "
+              f"{res['p99_ms']:9.2f} {res['queries_per_request']:8.2f} {res['errors']:7d}")
+    server.shutdown()
+
+    # Server and clients share this process, so this is an upper bound for the app alone.
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform != "darwin" else 1024 * 1024)
+    print(f"\npeak RSS: {peak_rss_mb:.0f} MB")
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump({
+                "revision": git_revision(),
+                "timestamp": datetime.utcnow().isoformat() + "Z",
+                "database": os.environ["DATABASE_URL"].split("@")[-1],  # drop credentials
+                "config": vars(args),
+                "peak_rss_mb": round(peak_rss_mb, 1),
+                "routes": results,
+            }, fh, indent=2)
+        print(f"wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
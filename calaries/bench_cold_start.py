@@ -0,0 +1,82 @@
+"""Cold-start benchmark: what a fresh (serverless) process pays before its first response.
+
+For every route, spawns new interpreters that import the app and serve one request,
+and reports import time and time-to-first-response (median / max over --runs). Then
+prints the slowest imports from `python -X importtime -c "import app"`.
+
+    python bench_cold_start.py --runs 10
+    python bench_cold_start.py --routes /,/login,/pricing --top 25
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROUTES = ["/", "/login", "/register", "/pricing", "/dashboard"]
+
+# Runs in the child interpreter; timings start before `import app`.
+CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+from app import app
+t1 = time.perf_counter()
+status = app.test_client().get(sys.argv[1]).status_code
+t2 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "first_response_ms": (t2 - t0) * 1000, "status": status}))
+"""
+
+
+def child_env():
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite:///bench_cold_start.db")
+    env.setdefault("SCAN_QUEUE_PATH", "bench_cold_start_jobs.db")
+    return env
+
+
+def time_route(route, runs):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", CHILD, route], capture_output=True, text=True,
+                             env=child_env(), check=True)
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def import_profile(top):
+    """(cumulative microseconds, module) for the slowest imports, parents included."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], capture_output=True,
+                         text=True, env=child_env(), check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routes", default=",".join(ROUTES))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    args = parser.parse_args()
+
+    print(f"{'route':14s} {'status':>6s} {'import p50':>11s} {'first resp p50':>15s} {'first resp max':>15s}")
+    for route in args.routes.split(","):
+        samples = time_route(route, args.runs)
+        imports = [s["import_ms"] for s in samples]
+        firsts = [s["first_response_ms"] for s in samples]
+        print(f"{route:14s} {samples[0]['status']:6d} {statistics.median(imports):9.0f}ms "
+              f"{statistics.median(firsts):13.0f}ms {max(firsts):13.0f}ms")
+
+    print("\nslowest imports (cumulative):")
+    for micros, name in import_profile(args.top):
+        print(f"{micros / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
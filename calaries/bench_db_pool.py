@@ -0,0 +1,140 @@
+"""Concurrency benchmark for the engine/pool settings in db_config.
+
+Runs a scan-like workload (mostly "today's total" reads, some FoodLog inserts that
+also bump daily_totals) from an increasing number of threads, once with SQLAlchemy's
+defaults and once with db_config.engine_options (+ WAL pragmas on SQLite). Reports
+throughput, latency percentiles, pool checkout wait and errors per worker count.
+
+    python bench_db_pool.py --workers 1,8,32,128 --seconds 10
+    python bench_db_pool.py --url mysql+pymysql://user:pw@localhost/nutriscan_bench
+
+The food_logs, daily_totals and users tables of the target database are recreated.
+"""
+import argparse
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import create_engine, select
+
+import db_config
+from app import DailyTotals, FoodLog, User
+
+TUNED_PRAGMAS = dict(db_config.SQLITE_PRAGMAS)
+# SQLite's own defaults; journal_mode is persistent, so it has to be set back explicitly.
+DEFAULT_PRAGMAS = {"journal_mode": "DELETE", "synchronous": "FULL"}
+
+
+def build_engine(url, tuned):
+    # The connect hook in db_config applies whatever SQLITE_PRAGMAS holds.
+    db_config.SQLITE_PRAGMAS.clear()
+    db_config.SQLITE_PRAGMAS.update(TUNED_PRAGMAS if tuned else DEFAULT_PRAGMAS)
+    return create_engine(url, **(db_config.engine_options(url) if tuned else {}))
+
+
+def seed(engine, users):
+    for table in (FoodLog.__table__, DailyTotals.__table__, User.__table__):
+        table.drop(engine, checkfirst=True)
+    for table in (User.__table__, FoodLog.__table__, DailyTotals.__table__):
+        table.create(engine)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"id": i, "username": f"user{i}", "email": f"user{i}@bench.local", "password": "x"}
+            for i in range(1, users + 1)
+        ])
+
+
+def read_today(conn, uid, today):
+    return conn.execute(
+        select(DailyTotals.calories).where(DailyTotals.user_id == uid, DailyTotals.day == today)
+    ).scalar()
+
+
+def write_scan(conn, uid, today):
+    conn.execute(FoodLog.__table__.insert(), {
+        "user_id": uid, "date": datetime.utcnow(), "display_name": "Bench plate",
+        "calories": 400, "protein": 20, "carbs": 40, "fat": 15,
+    })
+    updated = conn.execute(
+        DailyTotals.__table__.update()
+        .where(DailyTotals.user_id == uid, DailyTotals.day == today)
+        .values(calories=DailyTotals.calories + 400, count=DailyTotals.count + 1)
+    ).rowcount
+    if not updated:
+        conn.execute(DailyTotals.__table__.insert(), {
+            "user_id": uid, "day": today, "calories": 400, "protein": 20, "carbs": 40, "fat": 15, "count": 1,
+        })
+
+
+def run(engine, workers, seconds, users, write_ratio):
+    today = datetime.utcnow().date()
+    latencies, checkouts, errors = [], [], Counter()
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+
+    def worker(idx):
+        rng = random.Random(idx)
+        local_lat, local_checkout = [], []
+        while time.perf_counter() < stop:
+            uid = rng.randint(1, users)
+            t0 = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    local_checkout.append(time.perf_counter() - t0)
+                    if rng.random() < write_ratio:
+                        with conn.begin():
+                            write_scan(conn, uid, today)
+                    else:
+                        read_today(conn, uid, today)
+                local_lat.append(time.perf_counter() - t0)
+            except Exception as e:
+                with lock:
+                    errors[type(getattr(e, "orig", e)).__name__ + ": " + str(getattr(e, "orig", e))[:60]] += 1
+        with lock:
+            latencies.extend(local_lat)
+            checkouts.extend(local_checkout)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    checkouts.sort()
+    pct = lambda xs, p: xs[min(len(xs) - 1, int(len(xs) * p / 100))] * 1000 if xs else float("nan")
+    return {
+        "ops_per_s": len(latencies) / seconds,
+        "p50_ms": pct(latencies, 50),
+        "p99_ms": pct(latencies, 99),
+        "checkout_p99_ms": pct(checkouts, 99),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="sqlite:///bench_db_pool.db")
+    parser.add_argument("--workers", default="1,8,32,128")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    for label, tuned in (("defaults", False), ("db_config", True)):
+        engine = build_engine(args.url, tuned)
+        seed(engine, args.users)
+        print(f"\n=== {label} ({engine.pool.__class__.__name__}) ===")
+        print(f"{'workers':>7s} {'ops/s':>9s} {'p50 ms':>9s} {'p99 ms':>9s} {'checkout p99':>13s}  errors")
+        for workers in (int(w) for w in args.workers.split(",")):
+            res = run(engine, workers, args.seconds, args.users, args.write_ratio)
+            errors = ", ".join(f"{n}x {msg}" for msg, n in res["errors"].most_common(2)) or "-"
+            print(f"{workers:7d} {res['ops_per_s']:9.0f} {res['p50_ms']:9.2f} {res['p99_ms']:9.2f} "
+                  f"{res['checkout_p99_ms']:13.2f}  {errors}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
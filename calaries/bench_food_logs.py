@@ -0,0 +1,137 @@
+"""Benchmark for food_logs access paths with and without the composite indexes.
+
+Seeds a scratch database with synthetic logs, then runs the app's hot queries twice:
+once with the model-declared indexes dropped and once after migrate_db.ensure_indexes.
+Prints query plans and latency percentiles for each.
+
+    python bench_food_logs.py --rows 10000000 --users 20000
+    python bench_food_logs.py --url mysql+pymysql://user:pw@localhost/nutriscan_bench
+
+The target database is wiped (food_logs and users are recreated).
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+from app import FoodLog, FoodLogDetail, User
+from migrate_db import drop_indexes, ensure_indexes
+
+QUERIES = {
+    "today_total": (
+        "SELECT SUM(calories) FROM food_logs WHERE user_id = :uid AND date >= :day AND date < :next_day"
+    ),
+    "calendar_month": (
+        "SELECT DATE(date), SUM(calories) FROM food_logs "
+        "WHERE user_id = :uid AND date >= :month AND date < :next_month GROUP BY DATE(date)"
+    ),
+    "history_page": (
+        "SELECT id, date, display_name, calories FROM food_logs WHERE user_id = :uid "
+        "ORDER BY date DESC, id DESC LIMIT 20"
+    ),
+    "legacy_full_history": "SELECT * FROM food_logs WHERE user_id = :uid",
+    "admin_active_30d": "SELECT COUNT(DISTINCT user_id) FROM food_logs WHERE date >= :since",
+}
+
+
+def seed(engine, rows, users, days, batch=50000):
+    FoodLogDetail.__table__.drop(engine, checkfirst=True)  # references food_logs
+    FoodLog.__table__.drop(engine, checkfirst=True)
+    User.__table__.drop(engine, checkfirst=True)
+    User.__table__.create(engine)
+    FoodLog.__table__.create(engine)
+
+    now = datetime.utcnow()
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"id": i, "username": f"user{i}", "email": f"user{i}@bench.local", "password": "x"}
+            for i in range(1, users + 1)
+        ])
+
+    started = time.perf_counter()
+    insert = FoodLog.__table__.insert()
+    done = 0
+    while done < rows:
+        n = min(batch, rows - done)
+        chunk = [{
+            "user_id": rng.randint(1, users),
+            "date": now - timedelta(seconds=rng.randint(0, days * 86400)),
+            "display_name": "Grilled cheese sandwich",
+            "calories": rng.randint(50, 900),
+            "protein": rng.randint(0, 60),
+            "carbs": rng.randint(0, 120),
+            "fat": rng.randint(0, 60),
+        } for _ in range(n)]
+        with engine.begin() as conn:
+            conn.execute(insert, chunk)
+        done += n
+    print(f"seeded {rows:,} rows for {users:,} users in {time.perf_counter() - started:.1f}s")
+
+
+def explain(conn, sql, params):
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    return [" | ".join(str(c) for c in row) for row in conn.execute(text(prefix + sql), params)]
+
+
+def run(engine, users, samples, label):
+    rng = random.Random(7)
+    now = datetime.utcnow()
+    today = datetime.combine(now.date(), datetime.min.time())
+    month = today.replace(day=1)
+    base = {
+        "day": today, "next_day": today + timedelta(days=1),
+        "month": month, "next_month": (month + timedelta(days=32)).replace(day=1),
+        "since": now - timedelta(days=30),
+    }
+    print(f"\n=== {label} ===")
+    with engine.connect() as conn:
+        for name, sql in QUERIES.items():
+            params = dict(base, uid=1)
+            plan = explain(conn, sql, params)
+            # The site-wide query scans a lot either way; sample it less.
+            n = 3 if name == "admin_active_30d" else samples
+            timings = []
+            for _ in range(n):
+                params["uid"] = rng.randint(1, users)
+                t0 = time.perf_counter()
+                conn.execute(text(sql), params).fetchall()
+                timings.append((time.perf_counter() - t0) * 1000)
+            timings.sort()
+            p50 = timings[len(timings) // 2]
+            p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+            print(f"{name:22s} p50 {p50:9.2f} ms  p99 {p99:9.2f} ms")
+            for line in plan:
+                print(f"    plan: {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="sqlite:///bench_food_logs.db")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--days", type=int, default=730, help="history span to spread logs over")
+    parser.add_argument("--samples", type=int, default=200, help="timed executions per query")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse an already seeded database")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    if not args.skip_seed:
+        seed(engine, args.rows, args.users, args.days)
+
+    drop_indexes(engine, tables={"food_logs"})
+    run(engine, args.users, args.samples, "before (primary key only)")
+
+    t0 = time.perf_counter()
+    created = ensure_indexes(engine, tables={"food_logs"})
+    print(f"\ncreated {', '.join(created)} in {time.perf_counter() - t0:.1f}s")
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+    run(engine, args.users, args.samples, "after (composite indexes)")
+
+
+if __name__ == "__main__":
+    main()
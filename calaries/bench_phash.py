@@ -0,0 +1,109 @@
+"""Benchmark for the near-duplicate scan index.
+
+Builds a synthetic corpus of "plates", perturbs each one the way real re-uploads are
+perturbed (re-crop, re-compress, resize, brightness), and reports hit rate, false
+matches against unrelated images and lookup latency. The index is padded with random
+hashes so latency can be measured at production-like sizes.
+
+    python bench_phash.py --images 300 --filler 1000000 --distance 6
+"""
+import argparse
+import random
+import statistics
+import time
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageEnhance
+
+from phash_index import PerceptualIndex, dhash, hamming
+
+
+def synthetic_plate(rng, size=512):
+    img = Image.new("RGB", (size, size), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(rng.randrange(4, 10)):
+        x0, y0 = rng.randrange(size), rng.randrange(size)
+        x1, y1 = x0 + rng.randrange(40, size // 2), y0 + rng.randrange(40, size // 2)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.ellipse((x0, y0, x1, y1), fill=color)
+        else:
+            draw.rectangle((x0, y0, x1, y1), fill=color)
+    return img
+
+
+def perturb(img, rng):
+    w, h = img.size
+    dx, dy = int(w * rng.uniform(0, 0.03)), int(h * rng.uniform(0, 0.03))
+    img = img.crop((dx, dy, w - int(w * rng.uniform(0, 0.03)), h - int(h * rng.uniform(0, 0.03))))
+    scale = rng.uniform(0.5, 1.0)
+    img = img.resize((max(16, int(img.width * scale)), max(16, int(img.height * scale))))
+    img = ImageEnhance.Brightness(img).enhance(rng.uniform(0.85, 1.15))
+    buf = BytesIO()
+    img.save(buf, "JPEG", quality=rng.randrange(40, 90))
+    buf.seek(0)
+    return Image.open(buf)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=300, help="distinct synthetic plates")
+    parser.add_argument("--filler", type=int, default=200000, help="random hashes added to the index")
+    parser.add_argument("--distance", type=int, default=6, help="max Hamming distance for a match")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = PerceptualIndex(max_distance=args.distance)
+
+    originals = [synthetic_plate(rng) for _ in range(args.images)]
+    base_hashes = []
+    for i, img in enumerate(originals):
+        h = dhash(img)
+        base_hashes.append(h)
+        index.add(h, i)
+
+    started = time.perf_counter()
+    for _ in range(args.filler):
+        index.add(rng.getrandbits(64), -1)
+    build_s = time.perf_counter() - started
+
+    queries = [(i, dhash(perturb(img, rng))) for i, img in enumerate(originals)]
+    strangers = [dhash(synthetic_plate(rng)) for _ in range(args.images)]
+
+    latencies = []
+    hits = 0
+    distances = []
+    for i, h in queries:
+        t0 = time.perf_counter()
+        match = index.nearest(h)
+        latencies.append((time.perf_counter() - t0) * 1e6)
+        distances.append(hamming(h, base_hashes[i]))
+        if match and match[2] == i:
+            hits += 1
+
+    false_matches = sum(1 for h in strangers if index.nearest(h) is not None)
+
+    # Reference: brute-force scan over the same hashes for a handful of queries.
+    all_hashes = list(index._values)
+    linear = []
+    for _, h in queries[:20]:
+        t0 = time.perf_counter()
+        min(all_hashes, key=lambda c: hamming(h, c))
+        linear.append((time.perf_counter() - t0) * 1e6)
+
+    print(f"index size          : {len(index):,} hashes (built filler in {build_s:.1f}s)")
+    print(f"max distance        : {args.distance}")
+    print(f"perturbed hit rate  : {hits / len(queries):.1%}  (median true distance {statistics.median(distances)})")
+    print(f"false match rate    : {false_matches / len(strangers):.1%}")
+    print(f"lookup latency (us) : p50 {percentile(latencies, 50):.0f}  p99 {percentile(latencies, 99):.0f}")
+    print(f"linear scan (us)    : p50 {percentile(linear, 50):.0f}")
+
+
+if __name__ == "__main__":
+    main()
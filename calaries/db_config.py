@@ -0,0 +1,82 @@
+import os
+import sqlite3
+from functools import wraps
+
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import Select, event
+from sqlalchemy.engine import Engine, make_url
+
+
+# --- Engine Options ---
+def _env_flag(name, default):
+    return os.getenv(name, "1" if default else "0").lower() in ("1", "true", "yes")
+
+
+def engine_options(url, prefix="DB_"):
+    """SQLAlchemy engine kwargs for `url`, overridable through DB_* env vars.
+
+    Server databases get a bounded pool with pre-ping, and connections are recycled
+    before MySQL/MariaDB's wait_timeout closes them (hosted MariaDB often sets 300s).
+    SQLite keeps SQLAlchemy's default pool; see the connect hook below for its pragmas.
+    """
+    if make_url(url).get_backend_name() == "sqlite":
+        return {"connect_args": {"timeout": float(os.getenv(f"{prefix}SQLITE_BUSY_TIMEOUT", 15))}}
+    return {
+        "pool_size": int(os.getenv(f"{prefix}POOL_SIZE", 10)),
+        "max_overflow": int(os.getenv(f"{prefix}MAX_OVERFLOW", 20)),
+        "pool_timeout": float(os.getenv(f"{prefix}POOL_TIMEOUT", 10)),
+        "pool_recycle": int(os.getenv(f"{prefix}POOL_RECYCLE", 280)),
+        "pool_pre_ping": _env_flag(f"{prefix}POOL_PRE_PING", True),
+    }
+
+
+# --- SQLite Pragmas ---
+# WAL lets readers run alongside the single writer instead of failing with
+# "database is locked"; synchronous=NORMAL is durable across app crashes in WAL mode.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-20000"),  # negative = KiB
+    "temp_store": "MEMORY",
+}
+
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        if value:
+            cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+# --- Read Replica Routing ---
+REPLICA_BIND = "replica"
+
+
+def read_replica(f):
+    """Route SELECTs issued by this view to the replica bind (when one is configured)."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.read_replica = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+class RoutingSession(FlaskSession):
+    """Sends plain SELECTs from @read_replica views to the replica.
+
+    Flushes and any non-SELECT statement go to the primary, and once a request has
+    written, its later reads stay on the primary so it sees its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and REPLICA_BIND in self._db.engines and has_request_context() and g.get("read_replica"):
+            if self._flushing or (clause is not None and not isinstance(clause, Select)):
+                self.info["wrote"] = True
+            elif clause is not None and not self.info.get("wrote"):
+                return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
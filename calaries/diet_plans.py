@@ -0,0 +1,103 @@
+ACTIVITY_MULTIPLIERS = {"sedentary": 1.2, "light": 1.375, "moderate": 1.55, "active": 1.725}
+GOAL_OFFSETS = {"lose": -500, "gain": 500}
+
+
+# --- Calorie Targets ---
+def daily_calorie_target(weight, height, age, gender, activity, goal):
+    """Mifflin-St Jeor BMR x activity multiplier, shifted by the goal offset."""
+    bmr = (10 * weight) + (6.25 * height) - (5 * age) + (5 if gender == 'male' else -161)
+    tdee = bmr * ACTIVITY_MULTIPLIERS.get(activity, 1.2)
+    return int(tdee + GOAL_OFFSETS.get(goal, 0))
+
+
+def daily_calorie_targets(weights, heights, ages, genders, activities, goals):
+    """Batch form of daily_calorie_target for whole cohorts (same results, element-wise)."""
+    try:
+        import numpy as np  # only batch callers pay for the import
+    except ImportError:  # Batch evaluation falls back to plain Python.
+        return [daily_calorie_target(*row) for row in zip(weights, heights, ages, genders, activities, goals)]
+    weights = np.asarray(weights, dtype=float)
+    heights = np.asarray(heights, dtype=float)
+    ages = np.asarray(ages, dtype=float)
+    sex_offset = np.where(np.asarray(genders) == 'male', 5.0, -161.0)
+    multiplier = np.array([ACTIVITY_MULTIPLIERS.get(a, 1.2) for a in activities])
+    goal_offset = np.array([GOAL_OFFSETS.get(g, 0) for g in goals], dtype=float)
+    bmr = 10 * weights + 6.25 * heights - 5 * ages + sex_offset
+    # astype(int) truncates toward zero, matching int() in the scalar version.
+    return (bmr * multiplier + goal_offset).astype(int)
+
+
+# --- Plan Cache Keys ---
+def bucket(value, step):
+    return int(round(value / step) * step) if step else value
+
+
+def plan_profile_key(age, gender, weight, goal, daily_limit, weight_step=5, limit_step=100):
+    """Profiles that round to the same weight/limit bucket share one generated plan."""
+    return (int(age), gender or "", bucket(weight, weight_step), goal or "", bucket(daily_limit, limit_step))
+
+
+# --- Local Fallback Plans ---
+# Share of the daily target per meal slot.
+MEAL_SLOTS = [("Breakfast", 0.25), ("Lunch", 0.35), ("Snack", 0.10), ("Dinner", 0.30)]
+
+# (name, kcal for one portion, items, suited goals or None for any)
+MEAL_DB = {
+    "Breakfast": [
+        ("Oats & Berries Bowl", 320, ["1/2 cup rolled oats cooked in water", "1/2 cup mixed berries", "1 tbsp chia seeds"], None),
+        ("Veggie Egg Scramble", 280, ["2 eggs scrambled", "1 cup spinach & peppers", "1 slice whole-grain toast"], None),
+        ("Greek Yogurt Parfait", 250, ["170g plain Greek yogurt", "1/4 cup granola", "1/2 banana"], ("lose", "maintain")),
+        ("Peanut Butter Banana Toast", 450, ["2 slices whole-grain toast", "2 tbsp peanut butter", "1 banana"], ("gain", "maintain")),
+        ("Poha with Peanuts", 350, ["1.5 cups vegetable poha", "1 tbsp roasted peanuts", "Lemon & coriander"], None),
+    ],
+    "Lunch": [
+        ("Grilled Chicken Salad", 450, ["120g grilled chicken breast", "Large mixed greens salad", "1/2 cup cooked quinoa", "1 tbsp vinaigrette"], None),
+        ("Dal, Rice & Sabzi", 550, ["1 cup dal", "3/4 cup steamed rice", "1 cup mixed vegetable sabzi"], None),
+        ("Paneer Wrap", 520, ["1 whole-wheat wrap", "100g grilled paneer", "Salad vegetables & mint chutney"], None),
+        ("Lentil & Veg Soup with Bread", 400, ["2 cups lentil vegetable soup", "1 slice whole-grain bread"], ("lose", "maintain")),
+        ("Chicken Rice Bowl", 700, ["150g chicken thigh", "1 cup rice", "1 cup stir-fried vegetables", "1 tsp sesame oil"], ("gain", "maintain")),
+    ],
+    "Snack": [
+        ("Apple & Almonds", 180, ["1 medium apple", "10 almonds"], None),
+        ("Roasted Chana", 150, ["1/3 cup roasted chickpeas"], None),
+        ("Cottage Cheese & Carrots", 130, ["1/2 cup low-fat cottage cheese", "1 cup baby carrots"], ("lose", "maintain")),
+        ("Protein Smoothie", 300, ["1 scoop whey protein", "1 banana", "1 cup milk"], ("gain", "maintain")),
+    ],
+    "Dinner": [
+        ("Baked Salmon & Sweet Potato", 500, ["120g baked salmon", "1 medium sweet potato", "1 cup steamed asparagus"], None),
+        ("Tofu Stir-Fry", 420, ["150g firm tofu", "2 cups mixed vegetables", "1/2 cup brown rice"], None),
+        ("Roti & Chicken Curry", 550, ["2 whole-wheat rotis", "150g chicken curry (light oil)", "Cucumber salad"], None),
+        ("Grilled Fish & Veg", 380, ["150g grilled white fish", "2 cups roasted vegetables"], ("lose", "maintain")),
+        ("Pasta Bolognese", 680, ["1.5 cups whole-wheat pasta", "120g lean beef bolognese", "Side salad"], ("gain", "maintain")),
+    ],
+}
+
+
+def _portion_label(factor):
+    return "" if factor == 1 else f" &times; {factor:g} portion"
+
+
+def build_local_plan(daily_limit, goal):
+    """Deterministic 1-day plan from MEAL_DB whose portions add up close to `daily_limit`.
+
+    Picks, per slot, the meal that needs the smallest portion adjustment to hit the
+    slot's share of the target, with portions rounded to quarter servings.
+    """
+    sections = []
+    total = 0
+    for slot, share in MEAL_SLOTS:
+        target = daily_limit * share
+        options = [m for m in MEAL_DB[slot] if m[3] is None or goal in m[3]] or MEAL_DB[slot]
+        name, kcal, items, _ = min(options, key=lambda m: (abs(target / m[1] - 1), m[0]))
+        factor = max(0.5, min(2.0, round(target / kcal * 4) / 4))
+        meal_kcal = int(kcal * factor)
+        total += meal_kcal
+        lis = "".join(f"<li>{item}</li>" for item in items)
+        sections.append(
+            f"<li><h3>{slot}: {name}{_portion_label(factor)} (Approx. {meal_kcal} kcal)</h3><ul>{lis}</ul></li>"
+        )
+    return (
+        f"<h3>1-Day Plan (Target: {daily_limit} kcal, this plan: ~{total} kcal)</h3>"
+        f"<ul>{''.join(sections)}</ul>"
+    )
+
@@ -0,0 +1,127 @@
+import csv
+import json
+import zlib
+from datetime import date, datetime
+from io import BytesIO, StringIO
+
+EXPORT_COLUMNS = ["date", "food_name", "calories", "protein", "carbs", "fat"]
+EXPORT_HEADER = ["Date", "Food", "Calories", "Protein (g)", "Carbs (g)", "Fat (g)"]
+
+
+def _iter_batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+# --- Row Formats (each yields bytes) ---
+def csv_chunks(rows, header=EXPORT_HEADER, batch_size=1000):
+    # The csv module handles quoting; food names routinely contain commas.
+    buf = StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    for batch in _iter_batches(rows, batch_size):
+        writer.writerows(batch)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def ndjson_chunks(rows, columns=EXPORT_COLUMNS, batch_size=1000):
+    for batch in _iter_batches(rows, batch_size):
+        lines = [json.dumps(dict(zip(columns, row)), default=_json_default) for row in batch]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+_pyarrow = None
+
+
+def load_pyarrow():
+    """(pyarrow, pyarrow.parquet), imported on the first columnar export; None if not installed."""
+    global _pyarrow
+    if _pyarrow is None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:  # Columnar formats are optional.
+            return None
+        _pyarrow = (pyarrow, pyarrow.parquet)
+    return _pyarrow
+
+
+def _arrow_schema():
+    pa, _ = load_pyarrow()
+    return pa.schema([
+        ("date", pa.timestamp("us")),
+        ("food_name", pa.string()),
+        ("calories", pa.int32()),
+        ("protein", pa.int32()),
+        ("carbs", pa.int32()),
+        ("fat", pa.int32()),
+    ])
+
+
+def _arrow_batch(schema, batch):
+    pa, _ = load_pyarrow()
+    return pa.record_batch([list(col) for col in zip(*batch)], schema=schema)
+
+
+def parquet_chunks(rows, batch_size=50000):
+    """One Parquet row group per batch, flushed as soon as it is written."""
+    _, pq = load_pyarrow()
+    schema = _arrow_schema()
+    sink = BytesIO()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    for batch in _iter_batches(rows, batch_size):
+        writer.write_batch(_arrow_batch(schema, batch))
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    writer.close()
+    yield sink.getvalue()
+
+
+def arrow_chunks(rows, batch_size=50000):
+    """Arrow IPC stream format, one record batch per chunk."""
+    pa, _ = load_pyarrow()
+    schema = _arrow_schema()
+    sink = BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+    for batch in _iter_batches(rows, batch_size):
+        writer.write_batch(_arrow_batch(schema, batch))
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    writer.close()
+    yield sink.getvalue()
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+# format -> (chunk generator, mimetype, file extension, needs pyarrow)
+EXPORT_FORMATS = {
+    "csv": (csv_chunks, "text/csv", "csv", False),
+    "ndjson": (ndjson_chunks, "application/x-ndjson", "ndjson", False),
+    "parquet": (parquet_chunks, "application/vnd.apache.parquet", "parquet", True),
+    "arrow": (arrow_chunks, "application/vnd.apache.arrow.stream", "arrows", True),
+}
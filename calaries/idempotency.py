@@ -0,0 +1,158 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request body."""
+
+
+class RequestInProgress(Exception):
+    """The first request with this key is still running; `retry_after` is a hint in seconds."""
+
+    def __init__(self, message, retry_after=2):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class IdempotencyStore:
+    """Remembers the response for each (user, Idempotency-Key) in a table through `db`.
+
+    `model` must have `key` (primary key), `fingerprint`, `status_code` (NULL while the
+    first request runs), `response`, `mimetype` and `created_at` columns.
+
+    The first request inserts a pending row and runs; repeats get its stored response.
+    Repeats arriving while it runs wait up to `wait` seconds for it, on an Event when
+    the first request is in this process, by polling the row when it is in another.
+    Expired rows are purged by begin() at most every `purge_every` seconds.
+    """
+
+    def __init__(self, db, model, ttl_seconds=86400, wait=30.0, poll=0.25, pending_timeout=300,
+                 purge_every=3600):
+        self.db = db
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self.pending_timeout = pending_timeout
+        self.wait = wait
+        self.poll = poll
+        self.purge_every = purge_every
+        self._next_purge = 0.0
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.counters = {"new": 0, "replayed": 0, "coalesced": 0, "conflicts": 0, "purged": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _row(self, key):
+        m = self.model
+        row = self.db.session.execute(
+            select(m.fingerprint, m.status_code, m.response, m.mimetype, m.created_at).where(m.key == key)
+        ).first()
+        self.db.session.commit()  # end the read so the next poll sees other writers
+        return row
+
+    def _replay(self, key, fingerprint, row):
+        if row.fingerprint != fingerprint:
+            self._count("conflicts")
+            raise IdempotencyConflict("Idempotency-Key was already used with a different request")
+        self._count("replayed")
+        return row.response, row.status_code, row.mimetype
+
+    def _expired(self, row):
+        age = datetime.utcnow() - row.created_at
+        if row.status_code is None:
+            # Still pending long after any request would have finished: its worker died.
+            return age > timedelta(seconds=self.pending_timeout)
+        return age > timedelta(seconds=self.ttl_seconds)
+
+    def purge(self):
+        """Delete responses older than the TTL and pending rows whose worker died."""
+        m = self.model
+        now = datetime.utcnow()
+        purged = self.db.session.execute(delete(m).where(or_(
+            and_(m.status_code.isnot(None), m.created_at < now - timedelta(seconds=self.ttl_seconds)),
+            and_(m.status_code.is_(None), m.created_at < now - timedelta(seconds=self.pending_timeout)),
+        ))).rowcount
+        self.db.session.commit()
+        with self._lock:
+            self.counters["purged"] += purged
+        return purged
+
+    def _maybe_purge(self):
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_every
+        self.purge()
+
+    def begin(self, key, fingerprint):
+        """None if the caller should run the request, else the stored (body, status, mimetype)."""
+        self._maybe_purge()
+        deadline = time.monotonic() + self.wait
+        with self._lock:
+            event = self._inflight.get(key)
+            owns_event = event is None
+            if owns_event:
+                self._inflight[key] = threading.Event()
+        if not owns_event:
+            # Same process: wait for the first request instead of polling the table.
+            self._count("coalesced")
+            event.wait(self.wait)
+
+        while True:
+            row = self._row(key)
+            if row is not None and self._expired(row):
+                self.db.session.execute(delete(self.model).where(self.model.key == key))
+                self.db.session.commit()
+                row = None
+            if row is None:
+                try:
+                    self.db.session.add(self.model(key=key, fingerprint=fingerprint, created_at=datetime.utcnow()))
+                    self.db.session.commit()
+                except IntegrityError:
+                    self.db.session.rollback()
+                    continue  # another process claimed it first; look again
+                with self._lock:
+                    # Picked up after an abandoned attempt: later repeats wait on us.
+                    self._inflight.setdefault(key, threading.Event())
+                self._count("new")
+                return None
+            if row.status_code is not None or row.fingerprint != fingerprint:
+                if owns_event:
+                    self._release(key)
+                return self._replay(key, fingerprint, row)
+            if time.monotonic() >= deadline:
+                if owns_event:
+                    self._release(key)
+                raise RequestInProgress("A request with this Idempotency-Key is still being processed")
+            time.sleep(self.poll)
+
+    def complete(self, key, body, status_code, mimetype):
+        m = self.model
+        self.db.session.execute(
+            update(m).where(m.key == key).values(status_code=status_code, response=body, mimetype=mimetype)
+        )
+        self.db.session.commit()
+        self._release(key)
+
+    def abandon(self, key):
+        """Forget a request that failed, so a retry with the same key runs again."""
+        self.db.session.rollback()
+        self.db.session.execute(delete(self.model).where(self.model.key == key))
+        self.db.session.commit()
+        self._release(key)
+
+    def _release(self, key):
+        with self._lock:
+            event = self._inflight.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def stats(self):
+        return dict(self.counters)
@@ -0,0 +1,92 @@
+import threading
+import time
+from io import BytesIO
+
+FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+
+class PipelineStats:
+    """Running totals for the upload path: bytes received vs. bytes sent to the model."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.passthrough = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.decode_ms = 0.0
+        self.encode_ms = 0.0
+
+    def record(self, bytes_in, bytes_out, decode_ms=0.0, encode_ms=0.0, passthrough=False):
+        with self._lock:
+            self.images += 1
+            self.passthrough += int(passthrough)
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.decode_ms += decode_ms
+            self.encode_ms += encode_ms
+
+    def stats(self):
+        n = self.images or 1
+        return {
+            "images": self.images,
+            "passthrough": self.passthrough,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "compression_ratio": round(self.bytes_in / self.bytes_out, 2) if self.bytes_out else None,
+            "avg_decode_ms": round(self.decode_ms / n, 2),
+            "avg_encode_ms": round(self.encode_ms / n, 2),
+        }
+
+
+def _stream_size(stream):
+    pos = stream.tell()
+    stream.seek(0, 2)
+    size = stream.tell()
+    stream.seek(pos)
+    return size
+
+
+def preprocess_image(stream, max_dimension=1024, fmt="jpeg", quality=85, stats=None, fallback_mime="image/jpeg"):
+    """Decode, orient, downscale and re-encode an uploaded image.
+
+    Reads from `stream` through Pillow rather than slurping it, so large uploads that
+    Werkzeug spooled to disk are never fully buffered. Returns a Gemini inline part
+    `{"mime_type": ..., "data": ...}`. Files Pillow cannot decode are passed through as-is.
+    """
+    from PIL import Image, ImageOps  # imported on the first upload, not at app start
+
+    pil_format, mime_type = FORMATS[fmt]
+    stream.seek(0)
+    bytes_in = _stream_size(stream)
+
+    t0 = time.perf_counter()
+    try:
+        img = Image.open(stream)
+        if img.format == "JPEG":
+            # DCT-domain downscaling: decode at 1/2, 1/4 or 1/8 size when that still
+            # covers the target, which is much faster than decoding full resolution.
+            img.draft("RGB", (max_dimension, max_dimension))
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    except Exception:
+        stream.seek(0)
+        data = stream.read()
+        stream.seek(0)
+        if stats: stats.record(bytes_in, len(data), passthrough=True)
+        return {"mime_type": fallback_mime or "image/jpeg", "data": data}
+    t1 = time.perf_counter()
+
+    out = BytesIO()
+    img.save(out, pil_format, quality=quality, optimize=(pil_format == "JPEG"))
+    data = out.getvalue()
+    t2 = time.perf_counter()
+
+    stream.seek(0)
+    if stats: stats.record(bytes_in, len(data), (t1 - t0) * 1000, (t2 - t1) * 1000)
+    return {"mime_type": mime_type, "data": data}
@@ -0,0 +1,41 @@
+"""Bulk-import food logs for one user from another tracker's export.
+
+    python import_logs.py user@example.com history.csv
+    python import_logs.py user@example.com history.ndjson --batch-size 20000
+
+CSV needs a Date column (ISO date/time) plus any of Food, Calories, Protein, Carbs,
+Fat; our own /export_data CSV and NDJSON files load as-is. Everything is committed
+in one transaction, so a failed import leaves nothing behind.
+"""
+import argparse
+import time
+
+from app import app, User, import_food_logs
+from importers import IMPORT_FORMATS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("email")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=sorted(IMPORT_FORMATS), help="default: from the file extension")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    fmt = args.format or args.path.rsplit(".", 1)[-1].lower()
+    if fmt not in IMPORT_FORMATS:
+        parser.error(f"cannot tell the format of {args.path}; pass --format")
+
+    with app.app_context():
+        user = User.query.filter_by(email=args.email).first()
+        if not user:
+            parser.error(f"no user with email {args.email}")
+        t0 = time.perf_counter()
+        with open(args.path, "rb") as fh:
+            imported, days = import_food_logs(user.id, IMPORT_FORMATS[fmt](fh), batch_size=args.batch_size)
+        print(f"Imported {imported:,} logs over {days:,} days for {user.email} "
+              f"in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
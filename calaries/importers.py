@@ -0,0 +1,99 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+from exporters import EXPORT_COLUMNS, EXPORT_HEADER
+
+FOOD_NAME_MAX = 80  # stored as food_logs.display_name, VARCHAR(80)
+
+# Header aliases accepted in CSV files (our own export header plus common tracker names).
+CSV_ALIASES = dict(zip((h.lower() for h in EXPORT_HEADER), EXPORT_COLUMNS))
+CSV_ALIASES.update({
+    "datetime": "date", "timestamp": "date", "food": "food_name", "name": "food_name", "item": "food_name",
+    "kcal": "calories", "energy": "calories", "protein": "protein", "carbs": "carbs",
+    "carbohydrates": "carbs", "fat": "fat",
+})
+
+
+class RowError(ValueError):
+    """An input row could not be parsed; `line` is 1-based in the uploaded file."""
+
+    def __init__(self, line, message):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+
+
+def _parse_date(value):
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"date must be an ISO string, got {type(value).__name__}")
+    value = (value or "").strip()
+    if not value:
+        raise ValueError("missing date")
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        # Stored dates are naive UTC; times without an offset are taken as UTC already.
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _number(value):
+    if value in (None, ""):
+        return 0
+    return int(round(float(value)))
+
+
+def _row(record, line):
+    try:
+        return {
+            "date": _parse_date(record.get("date")),
+            "food_name": str(record.get("food_name") or "Imported entry")[:FOOD_NAME_MAX],
+            "calories": _number(record.get("calories")),
+            "protein": _number(record.get("protein")),
+            "carbs": _number(record.get("carbs")),
+            "fat": _number(record.get("fat")),
+        }
+    except (TypeError, ValueError) as e:
+        raise RowError(line, str(e)) from None
+
+
+# --- Row Formats (each yields {"date", "food_name", "calories", "protein", "carbs", "fat"}) ---
+def csv_rows(stream):
+    reader = csv.reader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    try:
+        header = next(reader, None)
+    except csv.Error as e:
+        raise RowError(1, str(e)) from None
+    if header is None:
+        return
+    columns = [CSV_ALIASES.get(h.strip().lower()) for h in header]
+    if "date" not in columns:
+        raise RowError(1, "header needs a Date column")
+    while True:
+        try:
+            values = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:  # e.g. a field over csv.field_size_limit()
+            raise RowError(reader.line_num, str(e)) from None
+        if not any(values):
+            continue
+        yield _row({c: v for c, v in zip(columns, values) if c}, reader.line_num)
+
+
+def ndjson_rows(stream):
+    for line, raw in enumerate(io.TextIOWrapper(stream, encoding="utf-8"), start=1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise RowError(line, f"invalid JSON ({e.msg})") from None
+        if not isinstance(record, dict):
+            raise RowError(line, "expected a JSON object")
+        yield _row(record, line)
+
+
+IMPORT_FORMATS = {"csv": csv_rows, "ndjson": ndjson_rows, "jsonl": ndjson_rows}
@@ -0,0 +1,115 @@
+import argparse
+
+from sqlalchemy import bindparam, inspect, select, text
+
+from app import app, db, FoodLog, FoodLogDetail, short_food_name
+
+# Brings an existing database (MySQL or SQLite) up to the current models
+# without dropping data: creates missing tables, adds missing nullable columns,
+# then missing indexes, and moves old scan notes into food_log_details.
+
+
+def add_missing_columns(engine, tables=None):
+    """ALTER TABLE ... ADD COLUMN for nullable model columns the database does not have yet."""
+    inspector = inspect(engine)
+    added = []
+    for table in db.metadata.sorted_tables:
+        if tables and table.name not in tables:
+            continue
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+            with engine.begin() as conn:
+                conn.execute(text(ddl))
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def ensure_indexes(engine, tables=None):
+    """Create every index declared on the models that the database does not have yet."""
+    inspector = inspect(engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        if tables and table.name not in tables:
+            continue
+        if not inspector.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+                created.append(index.name)
+    return created
+
+
+def drop_indexes(engine, tables=None):
+    """Drop the model-declared indexes (used by benchmarks to measure the 'before' state)."""
+    inspector = inspect(engine)
+    dropped = []
+    for table in db.metadata.sorted_tables:
+        if tables and table.name not in tables:
+            continue
+        if not inspector.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                index.drop(bind=engine)
+                dropped.append(index.name)
+    return dropped
+
+
+def backfill_food_log_details(engine, batch_size=2000, clear_food_name=False):
+    """Give pre-existing logs a display_name and move their notes into food_log_details.
+
+    Walks food_logs by id in batches, one transaction each, so it can be stopped and
+    rerun. With clear_food_name the legacy column is emptied once its text is copied.
+    """
+    logs, details = FoodLog.__table__, FoodLogDetail.__table__
+    set_values = {"display_name": bindparam("b_name")}
+    if clear_food_name:
+        set_values["food_name"] = None
+    update_logs = logs.update().where(logs.c.id == bindparam("b_id")).values(**set_values)
+    last_id, moved = 0, 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(logs.c.id, logs.c.food_name)
+                .where(logs.c.id > last_id, logs.c.display_name.is_(None))
+                .order_by(logs.c.id).limit(batch_size)
+            ).all()
+            if not rows:
+                return moved
+            names = {row.id: short_food_name(row.food_name) for row in rows}
+            have_details = set(conn.execute(
+                select(details.c.food_log_id).where(details.c.food_log_id.in_(list(names)))).scalars())
+            notes = [{"food_log_id": row.id, "notes": FoodLogDetail.pack(row.food_name)}
+                     for row in rows if row.food_name and row.id not in have_details]
+            if notes:
+                conn.execute(details.insert(), notes)
+            conn.execute(update_logs, [{"b_id": i, "b_name": name} for i, name in names.items()])
+        last_id = rows[-1].id
+        moved += len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bring the database up to the current models.")
+    parser.add_argument("--batch-size", type=int, default=2000, help="food_logs rows per backfill transaction")
+    parser.add_argument("--clear-food-name", action="store_true",
+                        help="empty food_logs.food_name once its text is in food_log_details")
+    args = parser.parse_args()
+    with app.app_context():
+        print("Creating missing tables...")
+        db.create_all()
+        print("Adding missing columns...")
+        added = add_missing_columns(db.engine)
+        print("Creating missing indexes...")
+        created = ensure_indexes(db.engine)
+        print("Moving scan notes to food_log_details...")
+        moved = backfill_food_log_details(db.engine, args.batch_size, args.clear_food_name)
+        print(f"Migration Complete. New columns: {', '.join(added) or 'none'}; "
+              f"new indexes: {', '.join(created) or 'none'}; logs backfilled: {moved}")
@@ -0,0 +1,58 @@
+import threading
+
+from scan_cache import MemoryCacheBackend
+
+
+class ObjectCache:
+    """Process-local TTL cache for small row snapshots, with hit/miss counters.
+
+    Store plain dicts (column values), never live ORM instances: an instance belongs
+    to the session that loaded it. A ttl of 0 disables the cache.
+    """
+
+    def __init__(self, name, ttl_seconds, max_entries=10000):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.backend = MemoryCacheBackend(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.ttl_seconds > 0
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.enabled:
+            self.backend.set(key, value)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            self.invalidations += 1
+        if key is None:
+            self.backend.clear()
+        else:
+            self.backend.delete(key)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "size": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
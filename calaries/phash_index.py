@@ -0,0 +1,117 @@
+import threading
+from itertools import combinations
+
+HASH_BITS = 64
+
+
+# --- Perceptual Hashing ---
+def dhash(image, hash_size=8):
+    """Difference hash: one bit per horizontal gradient on a (hash_size+1) x hash_size thumbnail."""
+    from PIL import Image
+    if image.format == "JPEG":
+        # Let libjpeg decode at a reduced scale; we only need a tiny thumbnail.
+        image.draft("L", (hash_size * 8, hash_size * 8))
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    width = hash_size + 1
+    for row in range(hash_size):
+        offset = row * width
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def hash_to_hex(value):
+    return f"{value:016x}"
+
+
+def hex_to_hash(text):
+    return int(text, 16)
+
+
+# --- Multi-Index Hashing ---
+class PerceptualIndex:
+    """Near-duplicate lookup over 64-bit hashes using multi-index hashing.
+
+    The hash is split into `chunks` disjoint substrings, each with its own exact-match
+    table. By the pigeonhole principle, any hash within distance d of the query agrees
+    with it on at least one substring to within d // chunks bits, so a lookup only probes
+    those neighbourhoods and verifies the few candidates found there.
+    """
+
+    def __init__(self, max_distance=6, chunks=4):
+        if HASH_BITS % chunks:
+            raise ValueError("chunks must divide 64")
+        self.max_distance = max_distance
+        self.chunks = chunks
+        self.chunk_bits = HASH_BITS // chunks
+        self._mask = (1 << self.chunk_bits) - 1
+        self._tables = [{} for _ in range(chunks)]
+        self._values = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def _split(self, value):
+        return [(value >> (i * self.chunk_bits)) & self._mask for i in range(self.chunks)]
+
+    def _neighbours(self, chunk, radius):
+        yield chunk
+        for r in range(1, radius + 1):
+            for bits in combinations(range(self.chunk_bits), r):
+                flipped = chunk
+                for b in bits:
+                    flipped ^= 1 << b
+                yield flipped
+
+    def add(self, value, payload):
+        with self._lock:
+            if value in self._values:
+                self._values[value] = payload
+                return
+            self._values[value] = payload
+            for table, chunk in zip(self._tables, self._split(value)):
+                table.setdefault(chunk, []).append(value)
+
+    def nearest(self, value, max_distance=None):
+        """Return (distance, hash, payload) of the closest stored hash within range, or None."""
+        limit = self.max_distance if max_distance is None else max_distance
+        radius = limit // self.chunks
+        best = None
+        seen = set()
+        with self._lock:
+            if value in self._values:
+                best = (0, value)
+            else:
+                for table, chunk in zip(self._tables, self._split(value)):
+                    for probe in self._neighbours(chunk, radius):
+                        for candidate in table.get(probe, ()):
+                            if candidate in seen:
+                                continue
+                            seen.add(candidate)
+                            d = hamming(value, candidate)
+                            if d <= limit and (best is None or d < best[0]):
+                                best = (d, candidate)
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return best[0], best[1], self._values[best[1]]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._values),
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._values)
@@ -0,0 +1,200 @@
+import cProfile
+import io
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from analyzer import LatencyHistogram
+
+
+class RequestHistogram(LatencyHistogram):
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.duration = RequestHistogram()
+        self._lock = threading.Lock()
+        self.totals = {"queries": 0, "sql_seconds": 0.0, "model_seconds": 0.0,
+                       "request_bytes": 0, "response_bytes": 0, "over_query_budget": 0}
+        self.max_queries = 0
+
+    def add(self, **values):
+        with self._lock:
+            for name, value in values.items():
+                self.totals[name] += value
+            self.max_queries = max(self.max_queries, values.get("queries", 0))
+
+
+# --- Request Profiler ---
+class RequestProfiler:
+    """Opt-in per-endpoint timings: wall time, SQL count/time, model time and payload bytes.
+
+    Per request the numbers go out as a `Server-Timing` header; aggregates are rendered
+    as Prometheus text by `render()`. Requests issuing more than `max_queries` statements
+    are logged and counted. With `sample_rate` > 0 that fraction of requests runs under
+    cProfile, and samples slower than `slow_ms` are kept in `profiles`.
+    """
+
+    def __init__(self, enabled=False, max_queries=20, sample_rate=0.0, slow_ms=500, keep_profiles=20):
+        self.enabled = enabled
+        self.max_queries = max_queries
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.profiles = deque(maxlen=keep_profiles)
+        self._endpoints = {}
+        self._lock = threading.Lock()
+        # cProfile hooks are interpreter-wide on 3.12+, so only one request is sampled at a time.
+        self._profile_slot = threading.Lock()
+        self.logger = None
+        self._listening = False
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        self.logger = app.logger
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        if not self._listening:  # engine hooks are global; install once per process
+            event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+            self._listening = True
+
+    # --- hooks ---
+    def _before_request(self):
+        g.profile = {"started": time.perf_counter(), "queries": 0, "sql_seconds": 0.0, "model_seconds": 0.0}
+        if self.sample_rate and random.random() < self.sample_rate and self._profile_slot.acquire(blocking=False):
+            g.profile["cprofile"] = cProfile.Profile()
+            g.profile["cprofile"].enable()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            conn.info.setdefault("profile_query_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("profile_query_started")
+        if not started or not has_request_context() or "profile" not in g:
+            return
+        g.profile["queries"] += 1
+        g.profile["sql_seconds"] += time.perf_counter() - started.pop()
+
+    @contextmanager
+    def timed(self, name):
+        """Adds the block's duration to the current request's `<name>_seconds`."""
+        if not (self.enabled and has_request_context() and "profile" in g):
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            g.profile[f"{name}_seconds"] += time.perf_counter() - t0
+
+    def _after_request(self, response):
+        prof = g.get("profile")
+        if prof is None:
+            return response
+        elapsed = time.perf_counter() - prof["started"]
+        endpoint = request.endpoint or "unmatched"
+        queries = prof["queries"]
+        over_budget = queries > self.max_queries
+        self._stats(endpoint).duration.observe(elapsed)
+        self._stats(endpoint).add(
+            queries=queries,
+            sql_seconds=prof["sql_seconds"],
+            model_seconds=prof["model_seconds"],
+            request_bytes=request.content_length or 0,
+            # Streamed bodies have no length yet; their time is not covered either.
+            response_bytes=response.calculate_content_length() or 0,
+            over_query_budget=int(over_budget),
+        )
+        if over_budget:
+            self.logger.warning("%s %s issued %d SQL queries (budget %d)",
+                                request.method, request.path, queries, self.max_queries)
+
+        timings = [
+            f"app;dur={elapsed * 1000:.1f}",
+            f'db;dur={prof["sql_seconds"] * 1000:.1f};desc="{queries} queries"',
+        ]
+        if prof["model_seconds"]:
+            timings.append(f"model;dur={prof['model_seconds'] * 1000:.1f}")
+        response.headers.add("Server-Timing", ", ".join(timings))
+
+        if "cprofile" in prof:
+            self._finish_profile(prof, endpoint, elapsed, queries)
+        return response
+
+    def _teardown_request(self, exc):
+        prof = g.pop("profile", None)
+        if prof and "cprofile" in prof:
+            # after_request did not run (the response failed to build).
+            prof.pop("cprofile").disable()
+            self._profile_slot.release()
+
+    def _finish_profile(self, prof, endpoint, elapsed, queries):
+        profiler = prof.pop("cprofile")
+        profiler.disable()
+        self._profile_slot.release()
+        if elapsed * 1000 < self.slow_ms:
+            return
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(30)
+        self.profiles.append({
+            "endpoint": endpoint,
+            "path": request.full_path,
+            "ms": round(elapsed * 1000, 1),
+            "queries": queries,
+            "at": time.time(),
+            "profile": out.getvalue(),
+        })
+
+    def _stats(self, endpoint):
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            with self._lock:
+                stats = self._endpoints.setdefault(endpoint, EndpointStats())
+        return stats
+
+    # --- reporting ---
+    def flagged(self):
+        """Endpoints that went over the query budget, with the worst count seen."""
+        return {name: s.max_queries for name, s in self._endpoints.items() if s.totals["over_query_budget"]}
+
+    def render(self, prefix="nutriscan"):
+        lines = [
+            f"# HELP {prefix}_request_duration_seconds Wall time spent in the view and hooks.",
+            f"# TYPE {prefix}_request_duration_seconds histogram",
+        ]
+        endpoints = sorted(self._endpoints.items())
+        for name, s in endpoints:
+            h = s.duration
+            for bound, count in zip(h.BUCKETS, h.bucket_counts):
+                lines.append(f'{prefix}_request_duration_seconds_bucket{{endpoint="{name}",le="{bound}"}} {count}')
+            lines.append(f'{prefix}_request_duration_seconds_bucket{{endpoint="{name}",le="+Inf"}} {h.count}')
+            lines.append(f'{prefix}_request_duration_seconds_sum{{endpoint="{name}"}} {h.total:.6f}')
+            lines.append(f'{prefix}_request_duration_seconds_count{{endpoint="{name}"}} {h.count}')
+
+        counters = [
+            ("sql_queries_total", "queries", "SQL statements executed."),
+            ("sql_duration_seconds_total", "sql_seconds", "Time spent executing SQL."),
+            ("model_duration_seconds_total", "model_seconds", "Time spent waiting on the model."),
+            ("request_bytes_total", "request_bytes", "Request body bytes received."),
+            ("response_bytes_total", "response_bytes", "Response body bytes sent (unstreamed only)."),
+            ("query_budget_exceeded_total", "over_query_budget", "Requests over the SQL query budget."),
+        ]
+        for metric, key, help_text in counters:
+            lines.append(f"# HELP {prefix}_{metric} {help_text}")
+            lines.append(f"# TYPE {prefix}_{metric} counter")
+            for name, s in endpoints:
+                value = s.totals[key]
+                value = f"{value:.6f}" if isinstance(value, float) else value
+                lines.append(f'{prefix}_{metric}{{endpoint="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,169 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import case, delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+class RateLimited(Exception):
+    """Raised when a bucket is empty; `retry_after` is whole seconds until enough refill."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_limit(spec):
+    """"20/hour" -> (capacity 20, refill 20/3600 per second); "none" or "" -> None (unlimited).
+
+    Raises ValueError for anything else.
+    """
+    if not spec or spec.strip().lower() in ("none", "0"):
+        return None
+    count, _, period = spec.partition("/")
+    seconds = PERIODS.get(period.strip().lower().rstrip("s") or "second")
+    try:
+        capacity = float(count)
+    except ValueError:
+        capacity = None
+    if seconds is None or capacity is None or capacity <= 0:
+        raise ValueError(f"invalid rate limit {spec!r}, expected '<count>/<{'|'.join(PERIODS)}>' or 'none'")
+    return capacity, capacity / seconds
+
+
+# --- Bucket Stores ---
+class MemoryRateStore:
+    """Per-process token buckets, LRU-bounded. Each worker process limits on its own."""
+
+    name = "memory"
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def consume(self, key, capacity, rate, cost, now):
+        """Takes `cost` tokens if available. Returns (allowed, tokens available before the call)."""
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            self._buckets[key] = (tokens - cost if allowed else tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)  # a forgotten bucket starts full again
+        return allowed, tokens
+
+    def purge(self, before):
+        """Forget buckets last used before `before` (epoch seconds); they are full again."""
+        purged = 0
+        with self._lock:
+            # Least recently used first, so stop at the first bucket still in use.
+            while self._buckets and next(iter(self._buckets.values()))[1] < before:
+                self._buckets.popitem(last=False)
+                purged += 1
+        return purged
+
+
+class SQLRateStore:
+    """Buckets in a table through the app's SQLAlchemy `db`, shared by all processes.
+
+    `model` must have `key` (primary key), `tokens` and `updated_at` (epoch seconds)
+    float columns. Refill and take happen in one conditional UPDATE, so concurrent
+    requests cannot both spend the last token.
+    """
+
+    name = "sql"
+
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+
+    def consume(self, key, capacity, rate, cost, now):
+        m = self.model
+        session = self.db.session
+        refilled = m.tokens + (now - m.updated_at) * rate
+        available = case((refilled > capacity, capacity), else_=refilled)
+        for _ in range(2):
+            taken = session.execute(
+                update(m).where(m.key == key, available >= cost)
+                .values(tokens=available - cost, updated_at=now)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if taken:
+                session.commit()
+                return True, None
+            row = session.execute(select(m.tokens, m.updated_at).where(m.key == key)).first()
+            if row is not None:
+                session.rollback()
+                return False, min(capacity, row.tokens + (now - row.updated_at) * rate)
+            try:
+                session.execute(insert(m).values(key=key, tokens=capacity - cost, updated_at=now))
+                session.commit()
+                return True, None
+            except IntegrityError:
+                # Another request created the bucket first; take from it instead.
+                session.rollback()
+        return False, 0.0
+
+    def purge(self, before):
+        """Delete buckets last used before `before` (epoch seconds); they are full again."""
+        purged = self.db.session.execute(delete(self.model).where(self.model.updated_at < before)).rowcount
+        self.db.session.commit()
+        return purged
+
+
+# --- Limiter ---
+class RateLimiter:
+    """Token buckets keyed by (scope, identity) with a limit per (scope, plan).
+
+    `limits` maps (scope, plan) -> "count/period" (see parse_limit). A missing or
+    "none" limit lets the request through without touching the store.
+
+    Every `purge_every` seconds the store drops buckets idle for longer than the
+    slowest full refill; such a bucket is full, exactly like one that was never made.
+    """
+
+    def __init__(self, store, limits, purge_every=3600):
+        self.store = store
+        self.limits = {key: parse_limit(spec) for key, spec in limits.items()}
+        self.refill_seconds = max((c / r for c, r in filter(None, self.limits.values())), default=0)
+        self.purge_every = purge_every
+        self._next_purge = 0.0
+        self._lock = threading.Lock()
+        self.counters = {}
+
+    def _maybe_purge(self, now):
+        with self._lock:
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_every
+        self.store.purge(now - self.refill_seconds)
+
+    def _count(self, scope, outcome):
+        with self._lock:
+            self.counters.setdefault(scope, {"allowed": 0, "limited": 0})[outcome] += 1
+
+    def hit(self, scope, plan, identity, cost=1):
+        limit = self.limits.get((scope, plan))
+        if limit is None or self.store is None:
+            return
+        capacity, rate = limit
+        # A request bigger than the whole bucket would never fit; charge it a full bucket.
+        cost = min(cost, capacity)
+        now = time.time()
+        self._maybe_purge(now)
+        allowed, tokens = self.store.consume(f"{scope}:{identity}", capacity, rate, cost, now)
+        if allowed:
+            self._count(scope, "allowed")
+            return
+        self._count(scope, "limited")
+        retry_after = max(1, math.ceil((cost - tokens) / rate))
+        raise RateLimited(f"Too many requests, try again in {retry_after}s", retry_after)
+
+    def stats(self):
+        return {"store": self.store.name if self.store else None, **self.counters}
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+
+# --- Cache Keys ---
+def schema_fingerprint(schema):
+    """Short stable hash of a JSON schema, so a schema change invalidates old entries."""
+    encoded = json.dumps(schema, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def make_scan_key(image_part, prompt, schema_version):
+    """Content address for a scan: image bytes + mime type + prompt + schema version."""
+    h = hashlib.sha256()
+    h.update(image_part.get("mime_type", "").encode("utf-8"))
+    h.update(b"\0")
+    h.update(image_part["data"])
+    h.update(b"\0")
+    h.update(prompt.encode("utf-8"))
+    h.update(b"\0")
+    h.update(schema_version.encode("utf-8"))
+    return h.hexdigest()
+
+
+# --- Backends ---
+class MemoryCacheBackend:
+    """In-process LRU with a per-entry TTL. Values are stored as JSON text."""
+
+    def __init__(self, max_entries=1024, ttl_seconds=86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLCacheBackend:
+    """Stores entries in a table through the app's SQLAlchemy `db`.
+
+    `model` must have `key` (primary key), `result` (text) and `created_at` columns.
+    Expired rows are deleted in bulk by get() at most every `purge_every` seconds, so
+    one-off keys do not stay forever.
+    """
+
+    def __init__(self, db, model, ttl_seconds=86400, purge_every=3600):
+        self.db = db
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self.purge_every = purge_every
+        self._next_purge = 0.0
+        self._lock = threading.Lock()
+
+    def purge(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        purged = self.model.query.filter(self.model.created_at < cutoff).delete(synchronize_session=False)
+        self.db.session.commit()
+        return purged
+
+    def _maybe_purge(self):
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_every
+        self.purge()
+
+    def get(self, key):
+        self._maybe_purge()
+        entry = self.db.session.get(self.model, key)
+        if entry is None:
+            return None
+        if entry.created_at < datetime.utcnow() - timedelta(seconds=self.ttl_seconds):
+            self.db.session.delete(entry)
+            self.db.session.commit()
+            return None
+        return entry.result
+
+    def set(self, key, value):
+        try:
+            self.db.session.merge(self.model(key=key, result=value, created_at=datetime.utcnow()))
+            self.db.session.commit()
+        except Exception:
+            # A concurrent writer stored the same key first; the content is identical.
+            self.db.session.rollback()
+
+    def clear(self):
+        self.model.query.delete()
+        self.db.session.commit()
+
+    def __len__(self):
+        return self.model.query.count()
+
+
+# --- Cache Facade ---
+class ScanCache:
+    """Result cache for image analyses with hit/miss counters."""
+
+    def __init__(self, backend, schema_version):
+        self.backend = backend
+        self.schema_version = schema_version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key_for(self, image_part, prompt):
+        return make_scan_key(image_part, prompt, self.schema_version)
+
+    def get(self, key):
+        raw = self.backend.get(key)
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        # Always hand out a fresh dict; callers decorate the result in place.
+        return json.loads(raw)
+
+    def set(self, key, result):
+        self.backend.set(key, json.dumps(result))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
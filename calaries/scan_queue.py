@@ -0,0 +1,244 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+class QueueFull(Exception):
+    """Raised when a job cannot be accepted; `retry_after` is a hint in seconds."""
+
+    def __init__(self, message, retry_after=5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# --- SQLite Job Store ---
+class SQLiteJobQueue:
+    """Durable scan job queue in a local SQLite file.
+
+    Jobs move queued -> running -> done/failed. Claims happen inside BEGIN IMMEDIATE
+    transactions so several worker threads (or processes sharing the file) never
+    pick up the same job.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS scan_jobs (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            mime_type TEXT,
+            payload BLOB,
+            result TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_scan_jobs_status_created ON scan_jobs (status, created_at);
+        CREATE INDEX IF NOT EXISTS ix_scan_jobs_user_status ON scan_jobs (user_id, status);
+    """
+
+    def __init__(self, path, max_pending=200, max_per_user=3, max_running_per_user=1):
+        self.path = path
+        self.max_pending = max_pending
+        self.max_per_user = max_per_user
+        self.max_running_per_user = max_running_per_user
+        self._ready = False
+        self._ready_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        # The file is created on first use so importing the app never touches disk.
+        if not self._ready:
+            with self._ready_lock:
+                if not self._ready:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(self.SCHEMA)
+                    self._ready = True
+        return conn
+
+    def enqueue(self, user_id, image_part):
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM scan_jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
+            if pending >= self.max_pending:
+                conn.execute("ROLLBACK")
+                raise QueueFull("Scan queue is full. Please retry shortly.", retry_after=10)
+            mine = conn.execute(
+                "SELECT COUNT(*) FROM scan_jobs WHERE user_id = ? AND status IN ('queued', 'running')",
+                (user_id,),
+            ).fetchone()[0]
+            if mine >= self.max_per_user:
+                conn.execute("ROLLBACK")
+                raise QueueFull("Too many scans in progress. Wait for one to finish.", retry_after=3)
+            conn.execute(
+                "INSERT INTO scan_jobs (id, user_id, status, mime_type, payload, created_at, updated_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, user_id, image_part["mime_type"], image_part["data"], now, now),
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return job_id
+
+    def claim(self):
+        """Atomically move the oldest eligible queued job to running and return it."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, user_id, mime_type, payload FROM scan_jobs j "
+                "WHERE status = 'queued' AND ("
+                "  SELECT COUNT(*) FROM scan_jobs r WHERE r.user_id = j.user_id AND r.status = 'running'"
+                ") < ? ORDER BY created_at LIMIT 1",
+                (self.max_running_per_user,),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE scan_jobs SET status = 'running', updated_at = ? WHERE id = ?",
+                (time.time(), row["id"]),
+            )
+            conn.execute("COMMIT")
+            return {
+                "id": row["id"],
+                "user_id": row["user_id"],
+                "image_part": {"mime_type": row["mime_type"], "data": row["payload"]},
+            }
+        finally:
+            conn.close()
+
+    def finish(self, job_id, result, failed=False):
+        # The image is not needed once the job has run.
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE scan_jobs SET status = ?, result = ?, payload = NULL, updated_at = ? WHERE id = ?",
+                ("failed" if failed else "done", json.dumps(result), time.time(), job_id),
+            )
+
+    def get(self, job_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT id, user_id, status, result, created_at, updated_at FROM scan_jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def requeue_stale(self, older_than=300):
+        """Return jobs stuck in running (e.g. after a worker crash) to the queue."""
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "UPDATE scan_jobs SET status = 'queued', updated_at = ? WHERE status = 'running' AND updated_at < ?",
+                (time.time(), time.time() - older_than),
+            ).rowcount
+
+    def purge(self, older_than=86400):
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "DELETE FROM scan_jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                (time.time() - older_than,),
+            ).rowcount
+
+
+# --- Worker Pool ---
+class ScanWorkerPool:
+    """Bounded pool of daemon threads that drain a job queue through `handler`.
+
+    `handler(job)` returns a JSON-serialisable result; a result containing "error"
+    (or an exception) marks the job failed. Finished jobs older than `keep_seconds`
+    are purged on start and then every `purge_every` seconds.
+    """
+
+    def __init__(self, queue, handler, workers=4, idle_poll=1.0, keep_seconds=86400, purge_every=3600):
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.idle_poll = idle_poll
+        self.keep_seconds = keep_seconds
+        self.purge_every = purge_every
+        self._next_purge = 0.0
+        self._purge_lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._finished = threading.Condition()
+        self._threads = []
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self.queue.requeue_stale()
+            self._maybe_purge()
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"scan-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            self._started = True
+
+    def notify(self):
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def _maybe_purge(self):
+        with self._purge_lock:
+            now = time.monotonic()
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_every
+        try:
+            self.queue.purge(self.keep_seconds)
+        except sqlite3.Error:
+            logger.warning("could not purge finished scan jobs", exc_info=True)
+
+    def _run(self):
+        # A worker must outlive any single failure (e.g. "database is locked"), or the
+        # pool would shrink for good; errors are logged and the loop goes on.
+        while True:
+            try:
+                job = self.queue.claim()
+            except sqlite3.Error:
+                logger.warning("could not claim a scan job", exc_info=True)
+                job = None
+            if job is None:
+                self._maybe_purge()
+                with self._wakeup:
+                    self._wakeup.wait(self.idle_poll)
+                continue
+            try:
+                result = self.handler(job)
+                failed = "error" in result
+            except Exception as e:
+                result, failed = {"error": str(e)}, True
+            try:
+                self.queue.finish(job["id"], result, failed=failed)
+            except sqlite3.Error:
+                # Left in running; requeue_stale picks it up on the next start.
+                logger.warning("could not record scan job %s", job["id"], exc_info=True)
+            with self._finished:
+                self._finished.notify_all()
+
+    def wait(self, job_id, timeout):
+        """Long-poll helper: block until the job leaves queued/running or `timeout` elapses."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.queue.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in ("done", "failed") or remaining <= 0:
+                return job
+            # Jobs finished by another process are only seen on the next poll.
+            with self._finished:
+                self._finished.wait(min(remaining, self.idle_poll))
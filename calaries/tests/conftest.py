@@ -0,0 +1,64 @@
+"""Shared fixtures. Offline: stub model, SQLite per test. Run `python -m pytest` from the repo root."""
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its configuration from the environment at import time, so point it
+# at scratch files and the offline stub model before anything imports it.
+_scratch = tempfile.mkdtemp(prefix="nutriscan-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_scratch, 'import.db')}",
+    "SCAN_QUEUE_PATH": os.path.join(_scratch, "scan_jobs.db"),
+    "ANALYZER_BACKEND": "stub",
+    "SCAN_CACHE_BACKEND": "none",
+    "PHASH_MAX_DISTANCE": "-1",
+    "RATE_LIMIT_STORE": "none",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+PASSWORD = "secret"
+
+
+@pytest.fixture
+def app(tmp_path):
+    flask_app = app_module.create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}",
+    })
+    with flask_app.app_context():
+        app_module.db.create_all()
+        yield flask_app
+        app_module.db.session.remove()
+
+
+@pytest.fixture
+def user(app):
+    u = app_module.User(username="tester", email="tester@example.com",
+                        password=generate_password_hash(PASSWORD, method="pbkdf2:sha256"))
+    app_module.db.session.add(u)
+    app_module.db.session.commit()
+    return u
+
+
+@pytest.fixture
+def client(app, user):
+    c = app.test_client()
+    r = c.post("/login", data={"email": user.email, "password": PASSWORD})
+    assert r.status_code == 302
+    return c
+
+
+def jpeg(color="red", size=(64, 64)):
+    """A small JPEG upload as a (stream, filename) pair for test client forms."""
+    from io import BytesIO
+
+    from PIL import Image
+    buf = BytesIO()
+    Image.new("RGB", size, color).save(buf, "JPEG")
+    buf.seek(0)
+    return buf, f"{color}.jpg"
@@ -0,0 +1,139 @@
+import json
+import time
+
+import pytest
+
+from analyzer import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    ReplayBackend,
+    ResilientAnalyzer,
+    StubBackend,
+)
+
+
+class SlowBackend(StubBackend):
+    def analyze_image(self, image_part, prompt, schema, timeout=None):
+        time.sleep(1.0)
+        return super().analyze_image(image_part, prompt, schema, timeout)
+
+
+class FlakyBackend(StubBackend):
+    """Fails the first `failures` calls, then answers like the stub."""
+
+    def __init__(self, failures, error=RuntimeError("upstream 503")):
+        super().__init__()
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def analyze_image(self, image_part, prompt, schema, timeout=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return super().analyze_image(image_part, prompt, schema, timeout)
+
+
+IMAGE = {"mime_type": "image/jpeg", "data": b"plate"}
+
+
+# --- Circuit Breaker ---
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_breaker_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # only one probe at a time
+
+
+def test_breaker_probe_success_closes():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_breaker_probe_failure_reopens():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=0.05)
+    for _ in range(5):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_open_breaker_rejects_calls():
+    analyzer = ResilientAnalyzer(FlakyBackend(failures=100), retries=0,
+                                 breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            analyzer.analyze_image(IMAGE, "p", {})
+    with pytest.raises(CircuitOpenError):
+        analyzer.analyze_image(IMAGE, "p", {})
+    assert analyzer.counters["rejected"] == 1
+
+
+# --- Deadlines and Retries ---
+def test_deadline_covers_the_whole_call():
+    analyzer = ResilientAnalyzer(SlowBackend(), deadline=0.3, retries=2, backoff=0.01, hedge_percentile=0)
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        analyzer.analyze_image(IMAGE, "p", {})
+    assert time.monotonic() - started < 0.6
+
+
+def test_transient_failure_is_retried():
+    backend = FlakyBackend(failures=1)
+    analyzer = ResilientAnalyzer(backend, retries=2, backoff=0.01)
+    assert analyzer.analyze_image(IMAGE, "p", {})["total_calories"] > 0
+    assert backend.calls == 2
+    assert analyzer.counters["retries"] == 1
+
+
+def test_permanent_errors_are_not_retried():
+    backend = FlakyBackend(failures=100, error=json.JSONDecodeError("bad", "doc", 0))
+    breaker = CircuitBreaker(failure_threshold=1)
+    analyzer = ResilientAnalyzer(backend, retries=2, backoff=0.01, breaker=breaker)
+    for _ in range(3):
+        with pytest.raises(json.JSONDecodeError):
+            analyzer.analyze_image(IMAGE, "p", {})
+    assert backend.calls == 3
+    assert breaker.state == "closed"
+
+
+def test_latency_is_tracked_per_operation():
+    analyzer = ResilientAnalyzer(StubBackend())
+    analyzer.analyze_image(IMAGE, "p", {})
+    analyzer.generate_text("Daily Limit: 1800 kcal. Goal: lose")
+    latency = analyzer.stats()["latency_seconds"]
+    assert latency["analyze_image"]["count"] == 1
+    assert latency["generate_text"]["count"] == 1
+
+
+# --- Replay ---
+def test_replay_returns_copies(tmp_path):
+    backend = ReplayBackend(str(tmp_path / "recorded.jsonl"), record_from=StubBackend())
+    first = backend.analyze_image(IMAGE, "p", {})
+    first["limit_alert"] = True
+    assert "limit_alert" not in backend.analyze_image(IMAGE, "p", {})
+    # A fresh backend replays what was recorded without calling the model.
+    replayed = ReplayBackend(str(tmp_path / "recorded.jsonl")).analyze_image(IMAGE, "p", {})
+    assert replayed == StubBackend().analyze_image(IMAGE, "p", {})
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+import app as app_module
+
+
+def add_logs(user, dates):
+    logs = [app_module.FoodLog(user_id=user.id, date=d, display_name=f"meal {i}", calories=100 + i)
+            for i, d in enumerate(dates)]
+    app_module.db.session.add_all(logs)
+    app_module.db.session.commit()
+    return logs
+
+
+def test_cursor_pages_cover_every_log_once(client, user):
+    start = datetime(2024, 5, 1, 8)
+    # Two logs share a timestamp, so the cursor has to break the tie on id.
+    dates = [start + timedelta(hours=h) for h in (0, 1, 1, 2, 3, 4, 5)]
+    logs = add_logs(user, dates)
+    expected = [log.id for log in sorted(logs, key=lambda log: (log.date, log.id), reverse=True)]
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        body = client.get("/get_all_history", query_string=params).get_json()
+        seen += [item["id"] for item in body["history"]]
+        pages += 1
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == expected
+    assert pages == 4
+
+
+def test_history_fields_and_label_fallback(client, user):
+    legacy = app_module.FoodLog(user_id=user.id, date=datetime(2024, 1, 1), food_name="Old notes", calories=50)
+    app_module.db.session.add(legacy)
+    app_module.db.session.commit()
+    body = client.get("/get_all_history", query_string={"fields": "id,food_name,protein"}).get_json()
+    assert body["history"] == [{"id": legacy.id, "food_name": "Old notes", "protein": None}]
+
+
+def test_invalid_cursor_is_rejected(client):
+    assert client.get("/get_all_history", query_string={"cursor": "nope"}).status_code == 400
+
+
+def test_other_users_logs_are_not_listed(client, user):
+    other = app_module.User(username="other", email="other@example.com", password="x")
+    app_module.db.session.add(other)
+    app_module.db.session.commit()
+    add_logs(other, [datetime(2024, 1, 1)])
+    assert client.get("/get_all_history").get_json()["history"] == []
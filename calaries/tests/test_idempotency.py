@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+
+import app as app_module
+from conftest import jpeg
+
+
+def test_repeated_key_replays_the_first_response(client):
+    headers = {"Idempotency-Key": "scan-1"}
+    first = client.post("/calculate_calories", data={"food_image": jpeg("red")}, headers=headers)
+    again = client.post("/calculate_calories", data={"food_image": jpeg("red")}, headers=headers)
+    assert first.status_code == again.status_code == 200
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert again.get_json() == first.get_json()
+    assert app_module.FoodLog.query.count() == 1
+
+
+def test_same_key_with_another_body_is_a_conflict(client):
+    headers = {"Idempotency-Key": "scan-2"}
+    client.post("/calculate_calories", data={"food_image": jpeg("red")}, headers=headers)
+    r = client.post("/calculate_calories", data={"food_image": jpeg("blue")}, headers=headers)
+    assert r.status_code == 422
+    assert app_module.FoodLog.query.count() == 1
+
+
+def test_requests_without_a_key_are_not_deduplicated(client):
+    for _ in range(2):
+        client.post("/calculate_calories", data={"food_image": jpeg("red")})
+    assert app_module.FoodLog.query.count() == 2
+
+
+def test_expired_keys_are_purged(app):
+    store = app_module.idempotency
+    old = datetime.utcnow() - timedelta(seconds=store.ttl_seconds + 60)
+    app_module.db.session.add_all([
+        app_module.IdempotencyKey(key="1:old", fingerprint="f", status_code=200, created_at=old),
+        app_module.IdempotencyKey(key="1:fresh", fingerprint="f", status_code=200, created_at=datetime.utcnow()),
+    ])
+    app_module.db.session.commit()
+    assert store.purge() == 1
+    assert [k.key for k in app_module.IdempotencyKey.query] == ["1:fresh"]
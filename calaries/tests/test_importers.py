@@ -0,0 +1,63 @@
+import csv
+import io
+from datetime import date, datetime
+
+import pytest
+
+import app as app_module
+from importers import RowError, csv_rows, ndjson_rows
+
+
+def rows(parser, text):
+    return list(parser(io.BytesIO(text.encode("utf-8"))))
+
+
+def test_csv_aliases_and_defaults():
+    parsed = rows(csv_rows, "Timestamp,Food,kcal\n2024-01-01 08:00,Oats,300\n")
+    assert parsed == [{"date": datetime(2024, 1, 1, 8), "food_name": "Oats", "calories": 300,
+                       "protein": 0, "carbs": 0, "fat": 0}]
+
+
+def test_offsets_are_converted_to_naive_utc():
+    parsed = rows(ndjson_rows, '{"date": "2025-03-01T02:00:00+05:30"}\n{"date": "2025-03-01T02:00:00Z"}\n')
+    assert [r["date"] for r in parsed] == [datetime(2025, 2, 28, 20, 30), datetime(2025, 3, 1, 2)]
+
+
+@pytest.mark.parametrize("text, message", [
+    ("[1, 2]\n", "line 1: expected a JSON object"),
+    ('{"date": 123}\n', "line 1: date must be an ISO string"),
+    ('{"date": "2024-01-01"}\n{not json}\n', "line 2: invalid JSON"),
+    ('{"date": "yesterday"}\n', "line 1: Invalid isoformat"),
+])
+def test_ndjson_errors_name_the_line(text, message):
+    with pytest.raises(RowError) as exc:
+        rows(ndjson_rows, text)
+    assert str(exc.value).startswith(message)
+
+
+def test_csv_errors_name_the_line():
+    with pytest.raises(RowError, match="header needs a Date column"):
+        rows(csv_rows, "Food,Calories\nOats,300\n")
+    too_big = 'Date,Food\n2024-01-01,"' + "x" * (csv.field_size_limit() + 1) + '"\n'
+    with pytest.raises(RowError, match="^line 2: field larger than field limit"):
+        rows(csv_rows, too_big)
+
+
+@pytest.mark.parametrize("payload, filename", [
+    (b"[1, 2]\n", "history.ndjson"),
+    (b'{"date": 123}\n', "history.ndjson"),
+    (b'Date,Food\n2024-01-01,"' + b"x" * 200000 + b'"\n', "history.csv"),
+])
+def test_import_route_rejects_bad_files_with_400(client, payload, filename):
+    r = client.post("/import_data", data={"file": (io.BytesIO(payload), filename)})
+    assert r.status_code == 400
+    assert "line" in r.get_json()["error"]
+    assert app_module.FoodLog.query.count() == 0
+
+
+def test_import_route_loads_rows_and_daily_totals(client, user):
+    text = "Date,Food,Calories\n2024-01-01 08:00,Oats,300\n2024-01-01 13:00,Rice,600\n2024-01-02 09:00,Eggs,200\n"
+    r = client.post("/import_data", data={"file": (io.BytesIO(text.encode()), "history.csv")})
+    assert r.get_json() == {"imported": 3, "days": 2}
+    totals = {t.day: t.calories for t in app_module.DailyTotals.query.filter_by(user_id=user.id)}
+    assert totals == {date(2024, 1, 1): 900, date(2024, 1, 2): 200}
@@ -0,0 +1,50 @@
+import random
+
+from phash_index import HASH_BITS, PerceptualIndex, hamming
+
+
+def brute_force(stored, query, max_distance):
+    distances = [hamming(query, h) for h in stored]
+    best = min(distances)
+    return best if best <= max_distance else None
+
+
+def flip_bits(value, count, rng):
+    for bit in rng.sample(range(HASH_BITS), count):
+        value ^= 1 << bit
+    return value
+
+
+def test_nearest_matches_brute_force():
+    rng = random.Random(7)
+    index = PerceptualIndex(max_distance=6)
+    stored = [rng.getrandbits(HASH_BITS) for _ in range(2000)]
+    for row_id, value in enumerate(stored):
+        index.add(value, row_id)
+
+    queries = [flip_bits(rng.choice(stored), rng.randint(0, 10), rng) for _ in range(300)]
+    queries += [rng.getrandbits(HASH_BITS) for _ in range(100)]
+    for query in queries:
+        expected = brute_force(stored, query, 6)
+        match = index.nearest(query)
+        if expected is None:
+            assert match is None
+        else:
+            distance, value, row_id = match
+            assert distance == expected == hamming(query, value)
+            assert stored[row_id] == value
+
+
+def test_nearest_respects_max_distance_override():
+    index = PerceptualIndex(max_distance=8)
+    index.add(0, "zero")
+    assert index.nearest((1 << 5) - 1) == (5, 0, "zero")
+    assert index.nearest((1 << 5) - 1, max_distance=4) is None
+
+
+def test_re_adding_a_hash_replaces_its_payload():
+    index = PerceptualIndex()
+    index.add(42, 1)
+    index.add(42, 2)
+    assert len(index) == 1
+    assert index.nearest(42) == (0, 42, 2)
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+import app as app_module
+from conftest import jpeg
+from rate_limit import MemoryRateStore, RateLimited, RateLimiter, SQLRateStore, parse_limit
+
+
+def test_parse_limit():
+    assert parse_limit("20/hour") == (20.0, 20 / 3600)
+    assert parse_limit("5/minutes") == (5.0, 5 / 60)
+    assert parse_limit("none") is None
+    with pytest.raises(ValueError):
+        parse_limit("20/h")
+    with pytest.raises(ValueError):
+        parse_limit("many/day")
+
+
+def test_bucket_empties_and_reports_retry_after():
+    limiter = RateLimiter(MemoryRateStore(), {("scan", "trial"): "2/minute"})
+    limiter.hit("scan", "trial", "u1")
+    limiter.hit("scan", "trial", "u1")
+    with pytest.raises(RateLimited) as exc:
+        limiter.hit("scan", "trial", "u1")
+    assert exc.value.retry_after == 30  # one token refills every 30s
+    limiter.hit("scan", "trial", "u2")  # buckets are per identity
+    limiter.hit("scan", "premium", "u1")  # no limit configured for this plan
+
+
+def test_idle_buckets_are_purged():
+    store = MemoryRateStore()
+    limiter = RateLimiter(store, {("scan", "trial"): "2/minute"})
+    store.consume("scan:old", 2, 2 / 60, 1, time.time() - 3600)
+    limiter.hit("scan", "trial", "new")
+    assert list(store._buckets) == ["scan:new"]
+
+
+def test_sql_store_shares_buckets(app):
+    limiter = RateLimiter(SQLRateStore(app_module.db, app_module.RateLimitBucket), {("diet", "trial"): "1/hour"})
+    limiter.hit("diet", "trial", "u1")
+    with pytest.raises(RateLimited):
+        limiter.hit("diet", "trial", "u1")
+    assert app_module.RateLimitBucket.query.count() == 1
+
+
+def test_route_answers_429_with_retry_after(client, monkeypatch):
+    monkeypatch.setattr(app_module, "rate_limiter",
+                        RateLimiter(MemoryRateStore(), {("scan", "trial"): "1/minute"}))
+    assert client.post("/calculate_calories", data={"food_image": jpeg("red")}).status_code == 200
+    r = client.post("/calculate_calories", data={"food_image": jpeg("blue")})
+    assert r.status_code == 429
+    assert r.headers["Retry-After"] == "60"